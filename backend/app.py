@@ -1,6 +1,11 @@
 import asyncio
+import atexit
+import queue
+import threading
+import time
 import streamlit as st
-from mcp_client import run_agent
+from event_loop import new_event_loop
+from mcp_client import get_knowledge, get_team, stream_agent, shutdown, start_price_refresher, warm_up_models
 import uuid
 
 # -----------------------------
@@ -8,11 +13,78 @@ import uuid
 # -----------------------------
 st.set_page_config(page_title="Ethereum Assistant", page_icon="❉")
 
+# -----------------------------
+# Persistent event loop
+# -----------------------------
+@st.cache_resource
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Runs one event loop in a background thread so the MCP session survives reruns."""
+    loop = new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    # Keep the ETH/CHF price warm so the price tool answers from memory
+    asyncio.run_coroutine_threadsafe(start_price_refresher(), loop)
+
+    # Start the MCP server and build the team before the first prompt arrives
+    # (if this fails, the first request simply tries again)
+    asyncio.run_coroutine_threadsafe(get_team(), loop)
+
+    # Shut down the MCP server subprocess and HTTP client when Streamlit exits
+    atexit.register(
+        lambda: asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+    )
+    return loop
+
+
+@st.cache_resource
+def warm_up() -> None:
+    """Preloads the Ollama models and the knowledge base once per process without blocking the first render."""
+    threading.Thread(target=warm_up_models, daemon=True).start()
+    threading.Thread(target=get_knowledge, daemon=True).start()
+
+
+# Streamlit re-renders the whole message on every update, so tokens are handed over in small batches
+STREAM_FLUSH_INTERVAL = 0.03  # seconds
+
+
+def stream_response(prompt: str, session_id: str):
+    """Feeds the agent's token stream from the background loop into st.write_stream."""
+    tokens = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for token in stream_agent(prompt, session_id=session_id):
+                tokens.put(token)
+        finally:
+            tokens.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_loop())
+    finished = False
+    while not finished:
+        # Wait for the next token, then collect whatever else arrives within the flush interval
+        parts = [tokens.get()]
+        deadline = time.monotonic() + STREAM_FLUSH_INTERVAL
+        while parts[-1] is not done and (timeout := deadline - time.monotonic()) > 0:
+            try:
+                parts.append(tokens.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        if parts[-1] is done:
+            parts.pop()
+            finished = True
+        if parts:
+            yield "".join(parts)
+
+    # Surface errors raised inside the agent run
+    future.result()
+
+
 # -----------------------------
 # Lightweight custom styling (CSS)
 # -----------------------------
-st.markdown(
-    """
+CSS = """
 <style>
     /* Limit width for better readability and center content a bit */
     .block-container {
@@ -46,39 +118,57 @@ st.markdown(
         padding: 0.75rem !important;
     }
 </style>
-""",
-    unsafe_allow_html=True,
-)
+"""
+
+
+def inject_css() -> None:
+    """Applies the custom CSS to the page."""
+    st.markdown(CSS, unsafe_allow_html=True)
+
 
 # -----------------------------
 # Sidebar with quick actions
 # -----------------------------
-quick_prompt = None  # will store sidebar button selection
+# (button label, prompt sent to the agent)
+QUICK_ACTIONS = [
+    ("Was ist Ethereum?", "Was ist Ethereum?"),
+    ("ETH/CHF Kurs", "Wie viel ist 1 ETH in CHF wert?"),
+    ("Was ist eine DAO?", "Erkläre mir eine DAO."),
+]
 
-with st.sidebar:
-    st.header("⚡ Schnellaktionen")
 
-    if st.button("Was ist Ethereum?"):
-        quick_prompt = "Was ist Ethereum?"
+def render_sidebar() -> str | None:
+    """Renders the sidebar and returns the prompt of a clicked quick action, if any."""
+    quick_prompt = None
 
-    if st.button("ETH/CHF Kurs"):
-        quick_prompt = "Wie viel ist 1 ETH in CHF wert?"
+    with st.sidebar:
+        st.header("⚡ Schnellaktionen")
 
-    if st.button("Was ist eine DAO?"):
-        quick_prompt = "Erkläre mir eine DAO."
+        for label, prompt in QUICK_ACTIONS:
+            if st.button(label):
+                quick_prompt = prompt
 
-    st.markdown("---")
+        st.markdown("---")
 
-    st.header("🔐 Hinweis")
-    st.markdown(
-        """
-    **Dieser Assistant ist ein Prototyp im Rahmen einer Bachelorarbeit.**
+        st.header("🔐 Hinweis")
+        st.markdown(
+            """
+        **Dieser Assistant ist ein Prototyp im Rahmen einer Bachelorarbeit.**
+
+        - Alle Interaktionen erfolgen in einer Testumgebung  
+        - Keine realen Vermögenswerte werden übertragen
+        - Keine finanzielle Entscheidungsgrundlage
+            """
+        )
+
+    return quick_prompt
 
-    - Alle Interaktionen erfolgen in einer Testumgebung  
-    - Keine realen Vermögenswerte werden übertragen
-    - Keine finanzielle Entscheidungsgrundlage
-        """
-    )
+
+inject_css()
+quick_prompt = render_sidebar()  # will store sidebar button selection
+
+warm_up()
+get_loop()  # starts the background loop (and price refresher) before the first prompt
 
 # -----------------------------
 # Main title and caption
@@ -89,6 +179,9 @@ st.caption("Interagiere in natürlicher Sprache mit der Blockchain.")
 # -----------------------------
 # Initialize chat history
 # -----------------------------
+# Only the most recent turns are kept so reruns don't slow down on long sessions
+MAX_TURNS = 20
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -131,13 +224,10 @@ if prompt_to_use:
     # Get assistant response
     with st.chat_message("assistant"):
         with st.spinner("Agenten-Team denkt nach ..."):
-            response_text = asyncio.run(
-                run_agent(
-                    prompt_to_use,
-                    session_id=st.session_state.session_id,
-                )
+            response_text = st.write_stream(
+                stream_response(prompt_to_use, st.session_state.session_id)
             )
-            st.markdown(response_text)
 
     # Store response in chat history
-    st.session_state.messages.append({"role": "assistant", "content": response_text})
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": response_text})
+    del st.session_state.messages[:-2 * MAX_TURNS]
\ No newline at end of file
@@ -0,0 +1,12 @@
+import asyncio
+
+# libuv-based event loop if installed (optional): uvloop on Linux/macOS, winloop on Windows
+try:
+    from uvloop import new_event_loop
+except ImportError:
+    try:
+        from winloop import new_event_loop
+    except ImportError:
+        new_event_loop = asyncio.new_event_loop
+
+__all__ = ["new_event_loop"]
@@ -1,6 +1,23 @@
+import asyncio
+import hashlib
 import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import httpx
+import lancedb
+import numpy as np
 import requests
 
+from cachetools import LRUCache, TTLCache
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
 from textwrap import dedent
 from agno.agent import Agent
@@ -14,6 +31,22 @@ from agno.models.openai import OpenAIChat
 from agno.tools.mcp import MCPTools
 from agno.vectordb.lancedb import LanceDb
 from agno.db.sqlite import SqliteDb
+from agno.models.message import Message
+from agno.run.base import RunStatus
+from agno.run.team import TeamRunEvent, TeamRunOutput
+from agno.session import TeamSession
+from mcp import StdioServerParameters
+from sqlalchemy import create_engine, event
+
+
+logger = logging.getLogger(__name__)
+
+# Verbose agno logging on every model/tool call is opt-in via AGNO_DEBUG=1
+DEBUG_MODE = os.getenv("AGNO_DEBUG") == "1"
+if not DEBUG_MODE:
+    logging.getLogger("agno").setLevel(logging.WARNING)
+
+OLLAMA_HOST = "http://localhost:11434"
 
 
 # =============================
@@ -24,40 +57,301 @@ from agno.db.sqlite import SqliteDb
 ROOT = Path(__file__).parent
 KNOWLEDGE_PATH = ROOT / "knowledge"
 
-# Create a LanceDB-backed vector knowledge base
-# Used by the Knowledge_Agent for explanations
-knowledge = Knowledge(
-    name="baa_knowledge",
-    vector_db=LanceDb(
-        table_name="baa_knowledge",
-        uri="lancedb_data",
-        #embedder=OpenAIEmbedder(),
-        embedder=OllamaEmbedder(id="openhermes", host="http://localhost:11434"),
-    ),
-)
+# Query embeddings are reused when the same search text comes up again (e.g. repeated quick actions)
+_embedding_cache: LRUCache = LRUCache(maxsize=512)
+
+
+@dataclass
+class CachedOllamaEmbedder(OllamaEmbedder):
+    """
+    OllamaEmbedder, der zuletzt berechnete Embeddings im Speicher hält und Knowledge-Chunks
+    gebündelt über /api/embed einbettet statt mit einer Anfrage pro Chunk.
+    """
+
+    enable_batch: bool = True
+    # Chunks per /api/embed request; 32 suits CPU inference, GPUs take larger batches (e.g. 128)
+    batch_size: int = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32"))
+    # Batch results waiting for LanceDb.insert, which still calls get_embedding once per chunk after batching
+    _batched: dict[str, list[float]] = field(default_factory=dict, init=False, repr=False)
+    # Texts that could not be embedded; LanceDb stores a zero vector for them instead of failing the import
+    failed: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self):
+        # OllamaEmbedder turns batching off (with a warning); this subclass implements it
+        enable_batch, self.enable_batch = self.enable_batch, False
+        super().__post_init__()
+        self.enable_batch = enable_batch
+
+    def get_embedding(self, text: str) -> list[float]:
+        embedding = self._batched.pop(text, None) or _embedding_cache.get(text)
+        if embedding is None:
+            embedding = super().get_embedding(text)
+            if embedding:
+                _embedding_cache[text] = embedding
+            else:
+                self.failed += 1
+        return embedding
+
+    async def async_get_embedding(self, text: str) -> list[float]:
+        embedding = self._batched.pop(text, None) or _embedding_cache.get(text)
+        if embedding is None:
+            embedding = await super().async_get_embedding(text)
+            if embedding:
+                _embedding_cache[text] = embedding
+            else:
+                self.failed += 1
+        return embedding
+
+    def _embed_kwargs(self) -> dict:
+        """Dieselben Zusatzparameter wie OllamaEmbedder bei Einzelanfragen."""
+        kwargs = {"dimensions": self.dimensions}
+        if self.options is not None:
+            kwargs["options"] = self.options
+        return kwargs
+
+    def _keep_batch(self, texts: list[str], embeddings: list[list[float]]) -> tuple[list[list[float]], list[dict | None]]:
+        """Merkt sich die Batch-Ergebnisse für get_embedding und gibt sie mit leerer Usage zurück."""
+        for text, embedding in zip(texts, embeddings):
+            # Wrong-sized vectors are dropped, so the single request path reports them like OllamaEmbedder does
+            if len(embedding) == self.dimensions:
+                self._batched[text] = embedding
+        return embeddings, [None] * len(embeddings)
+
+    def get_embeddings_batch_and_usage(self, texts: list[str]) -> tuple[list[list[float]], list[dict | None]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embed(model=self.id, input=texts[start:start + self.batch_size], **self._embed_kwargs())
+            embeddings.extend(response["embeddings"])
+        return self._keep_batch(texts, embeddings)
+
+    async def async_get_embeddings_batch_and_usage(self, texts: list[str]) -> tuple[list[list[float]], list[dict | None]]:
+        # Ollama handles at most OLLAMA_NUM_PARALLEL requests at once, more would only queue up there
+        slots = asyncio.Semaphore(int(os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+
+        async def embed_batch(batch: list[str]) -> list[list[float]]:
+            async with slots:
+                response = await self.aclient.embed(model=self.id, input=batch, **self._embed_kwargs())
+            return response["embeddings"]
+
+        batches = await asyncio.gather(
+            *(embed_batch(texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size))
+        )
+        return self._keep_batch(texts, [embedding for batch in batches for embedding in batch])
+
+
+# Recent knowledge searches; the same or a near-identical query reuses the retrieved chunks
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_TTL = 300  # seconds
+SEARCH_CACHE_MIN_SIMILARITY = 0.95  # cosine
+
+
+class CachedLanceDb(LanceDb):
+    """LanceDb, die wiederholte oder fast identische Suchen aus dem Speicher beantwortet."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (normalized query, limit) -> (unit query embedding, results)
+        self._search_cache: TTLCache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+        self._search_cache_lock = threading.Lock()
+
+    def _cached_search(self, query: str, limit: int) -> tuple[tuple, np.ndarray | None, list | None]:
+        """Cache key, normalisiertes Query-Embedding und ggf. gespeicherte Treffer für eine Suche."""
+        key = (" ".join(query.casefold().split()), limit)
+        with self._search_cache_lock:
+            hit = self._search_cache.get(key)
+            if hit is not None:
+                return key, None, hit[1]
+            entries = [entry for (_, entry_limit), entry in self._search_cache.items() if entry_limit == limit]
+
+        # Served from the embedder's cache when the real search runs afterwards
+        embedding = self.embedder.get_embedding(query)
+        if not embedding:
+            return key, None, None
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        if entries:
+            # All cosine similarities in one matrix-vector product
+            similarities = np.stack([entry[0] for entry in entries]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= SEARCH_CACHE_MIN_SIMILARITY:
+                return key, vector, entries[best][1]
+        return key, vector, None
+
+    def _store_search(self, key: tuple, vector: np.ndarray | None, results: list) -> None:
+        """Legt die Treffer einer Suche mit ihrem normalisierten Query-Embedding im Cache ab."""
+        if vector is not None and results:
+            with self._search_cache_lock:
+                self._search_cache[key] = (vector, results)
+
+    def search(self, query: str, limit: int = 5, filters=None) -> list:
+        if filters:
+            return super().search(query=query, limit=limit, filters=filters)
+
+        key, vector, results = self._cached_search(query, limit)
+        if results is None:
+            results = super().search(query=query, limit=limit)
+            self._store_search(key, vector, results)
+        return list(results)
+
+    async def async_search(self, query: str, limit: int = 5, filters=None) -> list:
+        if filters:
+            return await super().async_search(query=query, limit=limit, filters=filters)
+
+        key, vector, results = await asyncio.to_thread(self._cached_search, query, limit)
+        if results is None:
+            results = await super().async_search(query=query, limit=limit)
+            self._store_search(key, vector, results)
+        return list(results)
+
+
+LANCEDB_URI = "lancedb_data"
+EMBEDDER_MODEL = "openhermes"
+# Fingerprint of the documents that were last imported into the vector table
+INGEST_STAMP = Path(LANCEDB_URI) / ".ingest_stamp"
+# Below this many chunks a brute-force scan is faster than an IVF-PQ index (and PQ needs enough rows to train)
+ANN_INDEX_MIN_ROWS = 100_000
 
-# Load all documents inside /knowledge (PDFs, Markdown, etc.)
-knowledge.add_content(
-    path=str(KNOWLEDGE_PATH)
-)
+
+def _knowledge_fingerprint() -> str:
+    """Hash über Namen, Grösse und Änderungszeit aller Dokumente in /knowledge (ohne sie zu lesen)."""
+    digest = hashlib.sha256()
+    for path in sorted(p for p in KNOWLEDGE_PATH.rglob("*") if p.is_file()):
+        stat = path.stat()
+        digest.update(f"{path.relative_to(KNOWLEDGE_PATH).as_posix()}:{stat.st_mtime_ns}:{stat.st_size}\n".encode())
+    return digest.hexdigest()
+
+
+# LanceDB-backed vector knowledge base, used by the Knowledge_Agent for explanations.
+# Created lazily so importing this module never waits for LanceDB or embedding calls.
+_knowledge: Knowledge | None = None
+_knowledge_lock = threading.Lock()
+
+
+def get_knowledge() -> Knowledge:
+    """Öffnet die Knowledge Base beim ersten Aufruf und liest bei Bedarf die Dokumente ein."""
+    global _knowledge
+
+    with _knowledge_lock:
+        if _knowledge is None:
+            knowledge = Knowledge(
+                name="baa_knowledge",
+                vector_db=CachedLanceDb(
+                    table_name="baa_knowledge",
+                    uri=LANCEDB_URI,
+                    #embedder=OpenAIEmbedder(),
+                    # A whole batch of chunks is embedded per request, so allow more than a single embedding takes
+                    embedder=CachedOllamaEmbedder(id=EMBEDDER_MODEL, host=OLLAMA_HOST, timeout=60),
+                ),
+                # Only the best few chunks are passed to the model
+                max_results=3,
+            )
+
+            # Load all documents inside /knowledge (PDFs, Markdown, etc.)
+            # Skipped when the vector table is populated and the documents are unchanged; set REBUILD_KB=1 to force a re-import
+            fingerprint = _knowledge_fingerprint()
+            if (
+                os.getenv("REBUILD_KB") == "1"
+                or not knowledge.vector_db.exists()
+                or knowledge.vector_db.get_count() == 0
+                or not INGEST_STAMP.exists()
+                or INGEST_STAMP.read_text() != fingerprint
+            ):
+                # The async import embeds each document's chunks in batches (the sync one embeds chunk by chunk).
+                # get_knowledge runs in a worker thread (asyncio.to_thread), so it can drive its own event loop.
+                # Cached answers were written from the previous documents
+                _clear_semantic_cache()
+                embedder = knowledge.vector_db.embedder
+                embedder.failed = 0
+                asyncio.run(knowledge.add_content_async(
+                    path=str(KNOWLEDGE_PATH)
+                ))
+                # Chunks that failed to embed were stored as zero vectors; without the stamp the next start imports again
+                if embedder.failed:
+                    logger.warning("%d knowledge chunks could not be embedded, the import is repeated on the next start", embedder.failed)
+                    INGEST_STAMP.unlink(missing_ok=True)
+                else:
+                    INGEST_STAMP.parent.mkdir(parents=True, exist_ok=True)
+                    INGEST_STAMP.write_text(fingerprint)
+
+                if knowledge.vector_db.get_count() >= ANN_INDEX_MIN_ROWS:
+                    try:
+                        knowledge.vector_db.table.create_index(
+                            metric="cosine", vector_column_name="vector", index_type="IVF_PQ", replace=True
+                        )
+                    except Exception as e:
+                        logger.warning("Could not create vector index: %s", e)
+
+            _knowledge = knowledge
+
+    return _knowledge
 
 
 # =============================
 # Tools
 # =============================
 
+# Shared async HTTP client so price lookups reuse the TLS connection and don't block the event loop.
+# The transport retries failed connection attempts, so a dropped keep-alive socket doesn't surface as an error.
+_http_client = httpx.AsyncClient(
+    timeout=5.0,
+    headers={"User-Agent": "BAA-Blockchain-Assistant"},
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+    ),
+)
+
+COINGECKO_PRICE_URL = "https://api.coingecko.com/api/v3/simple/price"
+COINGECKO_PRICE_PARAMS = {"ids": "ethereum", "vs_currencies": "chf"}
+
+# ETH/CHF answers are reused for a short time instead of asking CoinGecko again
+PRICE_CACHE_TTL = 30  # seconds
+# A slightly older price is still answered immediately while a fresh one is fetched in the background
+PRICE_STALE_TTL = 120  # seconds
+_price_cache = {"t": 0.0, "v": None}
+
+# In-flight tool executions, so identical concurrent calls share one result
+_inflight: dict[tuple, asyncio.Task] = {}
+
+
+async def _coalesce(key: tuple, coro_factory):
+    """Runs coro_factory() once per key; concurrent callers with the same key await the same task."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(coro_factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+@lru_cache(maxsize=1)
+def _load_address_book() -> dict[str, str]:
+    """Loads address_book.json once and keeps it in memory for all lookups."""
+    address_book_path = ROOT / "address_book.json"
+
+    # json.loads parses the UTF-8 bytes directly, without a text-mode file wrapper
+    raw = json.loads(address_book_path.read_bytes())
+
+    # Keys are normalized once, so lookups are case-insensitive without per-call work
+    return {key.casefold(): address for key, address in raw.items()}
+
+
 @tool(show_result=True, stop_after_tool_call=True)
 def get_address_by_name(name: str) -> str:
     """
     Liest eine lokale JSON-Datei und gibt die passende Krypto-Adresse zurück.
     Args: name (str): Name der Person.
     """
-    address_book_path = Path(__file__).parent / "address_book.json"
+    return _address_by_name(name)
+
 
-    with address_book_path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+def _address_by_name(name: str) -> str:
+    """Adressbuch-Eintrag als Antworttext (auch für den Direktweg ohne Agent)."""
+    data = _load_address_book()
 
-    address = data.get(name)
+    address = data.get(name.strip().casefold())
     if address is None:
         return f"Kein Eintrag für '{name}' im Adressbuch gefunden."
     
@@ -65,301 +359,931 @@ def get_address_by_name(name: str) -> str:
 
 
 @tool(name="get_eth_chf_price", show_result=True, stop_after_tool_call=True)
-def get_eth_chf_price() -> str:
+async def get_eth_chf_price() -> str:
     """
     Ruft den aktuellen ETH/CHF-Kurs über eine öffentliche HTTP-API ab.
     Gibt eine kurze, laienverständliche Erklärung zurück.
     """
+    return await _eth_chf_price()
+
+
+async def _eth_chf_price() -> str:
+    """Kurs aus dem Cache, sonst ein (mit parallelen Aufrufen geteilter) CoinGecko-Abruf."""
+    if _price_cache["v"] is not None:
+        age = time.monotonic() - _price_cache["t"]
+        if age < PRICE_CACHE_TTL:
+            return _price_cache["v"]
+        if age < PRICE_STALE_TTL:
+            asyncio.create_task(_coalesce(("get_eth_chf_price",), _fetch_eth_chf_price))
+            return _price_cache["v"]
+
+    return await _coalesce(("get_eth_chf_price",), _fetch_eth_chf_price)
+
+
+async def _fetch_eth_chf_price() -> str:
+    """Fragt CoinGecko ab und legt das Ergebnis im Preis-Cache ab."""
     try:
-        response = requests.get(
-            "https://api.coingecko.com/api/v3/simple/price",
-            params={"ids": "ethereum", "vs_currencies": "chf"},
-            timeout=5,
-        )
-        response.raise_for_status()
-        data = response.json()
+        response = await _http_client.get(COINGECKO_PRICE_URL, params=COINGECKO_PRICE_PARAMS)
+        if response.status_code >= 400:
+            return f"Fehler beim Abrufen des ETH/CHF-Kurses: HTTP {response.status_code}"
+
+        # Parse the raw body directly; the payload is a tiny fixed-schema JSON object
+        data = json.loads(response.content)
 
         price = data["ethereum"]["chf"]
-        return f"1 ETH entspricht aktuell ungefähr {price:.2f} CHF (Quelle: CoinGecko)."
+        result = f"1 ETH entspricht aktuell ungefähr {price:.2f} CHF (Quelle: CoinGecko)."
+        _price_cache["t"] = time.monotonic()
+        _price_cache["v"] = result
+        return result
 
     except Exception as e:
         return f"Fehler beim Abrufen des ETH/CHF-Kurses: {e}"
 
 
+_price_refresher_task: asyncio.Task | None = None
+
+
+async def _price_refresher() -> None:
+    """Hält den Preis-Cache im Hintergrund aktuell, damit Nutzeranfragen nie auf CoinGecko warten."""
+    delay = PRICE_CACHE_TTL
+    while True:
+        last_update = _price_cache["t"]
+        await _coalesce(("get_eth_chf_price",), _fetch_eth_chf_price)
+
+        if _price_cache["t"] > last_update:
+            delay = PRICE_CACHE_TTL
+        else:
+            # Back off on failures (e.g. CoinGecko rate limit), up to 5 minutes
+            delay = min(delay * 2, 300)
+
+        # Refresh slightly before the cache expires; jitter avoids a fixed request rhythm
+        await asyncio.sleep(delay * random.uniform(0.8, 0.95))
+
+
+async def start_price_refresher() -> None:
+    """Startet den Hintergrund-Refresh für den ETH/CHF-Kurs (nur einmal pro Prozess)."""
+    global _price_refresher_task
+
+    if _price_refresher_task is None or _price_refresher_task.done():
+        _price_refresher_task = asyncio.create_task(_price_refresher())
+
+
+# =============================
+# MCP Session
+# =============================
+
+# Started with this interpreter (the active venv) and an absolute path, independent of PATH and cwd
+MCP_SERVER_PARAMS = StdioServerParameters(command=sys.executable, args=[str(ROOT / "mcp_server.py")])
+
+# One MCP server subprocess is kept alive for the whole app instead of one per message
+_mcp_tools: MCPTools | None = None
+_mcp_lock = asyncio.Lock()
+
+
+async def get_mcp_tools() -> MCPTools:
+    """Startet den MCP-Server beim ersten Aufruf und gibt danach dieselbe Session zurück."""
+    global _mcp_tools
+
+    async with _mcp_lock:
+        if _mcp_tools is None:
+            mcp_tools = MCPTools(server_params=MCP_SERVER_PARAMS)
+            await mcp_tools.__aenter__()
+            _mcp_tools = mcp_tools
+
+    return _mcp_tools
+
+
+async def call_mcp_tool(tool_name: str, **kwargs) -> str:
+    """Ruft ein Tool des MCP-Servers direkt (ohne LLM) über die bestehende Session auf."""
+    mcp_tools = await get_mcp_tools()
+    result = await mcp_tools.session.call_tool(tool_name, kwargs)
+    return "\n".join(item.text for item in result.content if getattr(item, "type", None) == "text")
+
+
+async def close_mcp_tools() -> None:
+    """Beendet die MCP-Session und den Server-Prozess."""
+    global _mcp_tools, _team
+
+    async with _mcp_lock:
+        if _mcp_tools is not None:
+            await _mcp_tools.__aexit__(None, None, None)
+            _mcp_tools = None
+            # The cached team still points at the closed session
+            _team = None
+
+
+async def shutdown() -> None:
+    """Gibt alle langlebigen Ressourcen (MCP-Server, HTTP-Client) wieder frei."""
+    if _price_refresher_task is not None:
+        _price_refresher_task.cancel()
+    await close_mcp_tools()
+    await _http_client.aclose()
+
+
+# =============================
+# Agent Instructions
+# =============================
+
+_ETH_INSTRUCTIONS = dedent("""
+    Du bist Ethereum- und DAO-Assistent.
+
+    Rolle:
+    - Du führst Blockchain-Aktionen aus (Abstimmungen, ETH-/Token-Transaktionen).
+    - Du lieferst Netzwerk- und Gasinformationen auf Anfrage.
+    - Du entscheidest NICHT selbst über Bestätigungen, das macht immer der Teamleiter.
+
+    Regeln:
+    - Wenn der Teamleiter dich bittet, eine Transaktion auszuführen,
+      gilt das immer als bereits bestätigte Transaktion.
+    - Du stellst KEINE weiteren Rückfragen zur Bestätigung.
+
+    - Du führst send_eth und send_erc20_token NUR aus,
+      wenn der Teamleiter dich dazu beauftragt. 
+
+    - Wenn der Teamleiter in PHASE 1 eine Gebühren-/Gas-Schätzung verlangt:
+      - Nutze get_network_gas_price.
+      - Führe dabei KEINE Transaktion aus.
+      - Gib eine kurze, laienverständliche Einschätzung zurück:
+        • aktuelle Netzwerkgebühren (z.B. niedrig/mittel/hoch)
+        • optional ein kurzer Hinweis, dass Gebühren je nach Netzlast schwanken.
+
+    - Für reine Informationen verwendest du:
+      - dao_list_proposals, dao_get_winner, dao_vote
+      - get_eth_balance, get_erc20_token_balance
+      - get_network_gas_price
+
+    - Nach einer ausgeführten Transaktion erklärst du kurz:
+      • Betrag
+      • Empfängeradresse
+      • Transaktions-Hash als digitalen Zahlungsbeleg
+
+    - Du erwähnst niemals Toolnamen.
+    - Antworten immer kurz, klar und laienverständlich.
+    """)
+
+_ADDRESS_BOOK_INSTRUCTIONS = dedent("""
+    Du bist nur für das Nachschlagen von Krypto-Adressen zuständig.
+
+    Regeln:
+    - Verwende ausschliesslich das Tool get_address_by_name.
+    - Keine Erklärungen zu Blockchain, DAO, Transaktionen etc.
+    - Antworte nur mit:
+      - gefundener Adresse oder
+      - klarer Fehlermeldung, wenn kein Eintrag existiert.
+    - Antwort kurz, ohne Zusatztexte.
+    """)
+
+_PRICE_INSTRUCTIONS = dedent("""
+    Du bist nur für ETH/CHF-Preisabfragen zuständig.
+
+    Regeln:
+    - Wenn nach Preis oder Kurs von ETH/Ethereum in CHF gefragt wird,
+      nutze IMMER das Tool get_eth_chf_price.
+    - Erfinde niemals einen Kurs, nutze nur das Tool-Ergebnis.
+    - Antworte kurz, z.B.:
+      "1 ETH entspricht aktuell ca. X CHF. Der Kurs kann sich laufend ändern."
+    """)
+
+_KNOWLEDGE_INSTRUCTIONS = dedent("""
+    Du bist ein Erklär-Agent für Einsteiger zu Ethereum, Blockchain, Smart Contracts, DAOs usw.
+
+    WICHTIG:
+    - Vor jeder Antwort MUSST du zuerst die Knowledge Base über search_knowledge_base
+      mit der Nutzerfrage durchsuchen.
+    - Keine direkte Antwort ohne Knowledge-Suche.
+    """)
+
+_TEAM_INSTRUCTIONS = dedent("""
+    Du koordinierst vier Agenten (Ethereum, Address Book, Price, Knowledge) und antwortest nur auf Deutsch.
+
+    Deine Aufgaben:
+    - Richte Nutzerfragen an den passenden Agenten.
+    - Halte den 3-Phasen-Ablauf bei Transaktionen strikt ein (HITL).
+    - Fasse Agenten-Antworten laienverständlich zusammen.
+    - Keine Toolnamen nennen. Keine internen Agenten-/Systemdetails nennen.
+
+    ========================
+    ROUTING
+    ========================
+    - DAO / Voting / Proposal / Gewinner / Abstimmungen → Ethereum_Agent
+    - Personennamen → Krypto-Adressen → Address_Book_Agent
+    - ETH/CHF-Kurs oder ETH-Preis in CHF → Price_Agent
+    - Grundlagen / Erklärungen (Ethereum, Blockchain, Smart Contracts, DAO etc.) → Knowledge_Agent
+    - Endet die Nachricht mit "[Ohne Knowledge-Suche]": Knowledge_Agent NICHT beauftragen,
+      sondern die Frage selbst kurz und sachlich beantworten (z.B. zu anderen Coins oder Netzwerken).
+    - Kombiniert (z.B. "Was ist Ethereum und wie ist der Kurs?"):
+      → Knowledge_Agent (Erklärung) und Price_Agent (Kurs) im selben Schritt beauftragen,
+        in der Antwort zuerst die Erklärung, dann den Kurs.
+    - Voneinander unabhängige Aufträge an verschiedene Agenten gibst du immer gleichzeitig
+      im selben Schritt ab, nicht nacheinander.
+
+    WICHTIG:
+    - Der Price_Agent ist ausschliesslich für ETH/CHF zuständig.
+    - Tokenpreise (ERC20) werden NICHT über den Price_Agent abgefragt.
+    - Der Price_Agent liefert immer nur den Kurs für 1 ETH in CHF:
+      Beträge (z.B. "5 ETH in CHF") rechnest du selbst mit diesem Kurs um.
+      Bei anderen Coins, Tokens oder Währungen erklärst du, dass nur der ETH/CHF-Kurs unterstützt wird.
+    - Für Token-Transaktionen sind Preisangaben in CHF optional und werden standardmässig NICHT verlangt.
+
+    ========================
+    TRANSAKTIONSABLÄUFE (ETH & ERC20)
+    ========================
+    Wenn der Nutzer eine Transaktion ausführen will (ETH oder ERC20-Token), gilt strikt:
+
+    --------------------------------
+    PHASE 1 – ERKLÄRUNG (KEINE Ausführung)
+    --------------------------------
+    Ziel: Alle nötigen Details sammeln und eine klare Zusammenfassung liefern.
+    In Phase 1 dürfen KEINE Sende-Aktionen ausgeführt werden.
+
+    1) Empfänger klären
+    - Wenn ein Personenname genannt ist (z.B. "Patrick", "Alice"):
+      → Address_Book_Agent fragen und die Adresse übernehmen.
+    - Wenn eine Adresse angegeben ist:
+      → direkt verwenden.
+
+    2) Transaktionsart erkennen
+    - ETH-Transaktion: Nutzer schreibt ETH/Ether oder nennt ETH eindeutig.
+    - ERC20-Transaktion: Nutzer nennt "Token" oder einen Tokennamen (z.B. "Voltaze Token", "VLZ") oder sagt explizit ERC20.
+
+    3) Gebühren/Gas & Zusatzinfos beschaffen (PFLICHT)
+    - Bevor du die Phase-1-Zusammenfassung formulierst,
+      MUSST du den Ethereum_Agent nach den aktuellen Netzwerkgebühren fragen.
+    - Wenn keine exakte Schätzung möglich ist:
+      - gib eine qualitative Einschätzung (z.B. niedrig / mittel / hoch),
+      - aber brich die Transaktion NICHT ab.
+
+    - ETH-Transaktion:
+      - CHF-Wert von ETH über Price_Agent (nur ETH/CHF).
+      - Netzwerkgebühren über Ethereum_Agent.
+    - ERC20-Transaktion:
+      - KEINE CHF-Preisabfrage über Price_Agent.
+      - Netzwerkgebühren über Ethereum_Agent.
+      - Für die Überweisung/Transaktion muss das Guthaben nicht geprüft werden - weder bei dem Sender noch beim Empfänger.
+    - Adresse (Schritt 1), CHF-Wert und Netzwerkgebühren hängen nicht voneinander ab:
+      Frage die benötigten Agenten dafür gleichzeitig im selben Schritt an.
+
+    4) Phase-1-Zusammenfassung formulieren (immer laienverständlich)
+    - ETH-Transaktion (Beispiel):
+      "Du möchtest X ETH (≈ Y CHF) an Adresse Z senden.
+      Geschätzte Netzwerkgebühren: G.
+      Wenn das so stimmt, antworte bitte mit: 'Ja, bitte ausführen'."
+    - ERC20-Transaktion (Beispiel):
+      "Du möchtest X [Tokenname] an Adresse Z senden.
+      Geschätzte Netzwerkgebühren: G.
+      Wenn das so stimmt, antworte bitte mit: 'Ja, bitte ausführen'."
+
+    Vorab ermittelte Informationen:
+    - Enthält die Nutzer-Nachricht einen Block "[Vorab ermittelt]" (Adresse, ETH/CHF-Kurs, Netzwerkgebühren),
+      verwende diese Angaben direkt und frage die Agenten dafür NICHT erneut.
+    - Fehlt eine Angabe im Block, beschaffe nur diese wie oben beschrieben.
+
+    Regeln in Phase 1:
+    - Wenn Betrag, Empfänger oder Tokenname fehlen/unklar sind: gezielte Rückfrage stellen.
+    - Wenn Tokenname unklar ist: nach exaktem Token (Name/Contract) fragen.
+    - Keine Aussagen wie "ich habe keinen Zugriff auf den Tokenpreis" als Abbruchgrund verwenden.
+      Stattdessen: CHF-Wert einfach weglassen (bei ERC20).
+    - Bei Fehlern (z.B. Whitelist/ungültige Adresse): klar erklären, dass es so nicht geht, und was benötigt wird.
+
+    --------------------------------
+    PHASE 2 – BESTÄTIGUNG
+    --------------------------------
+    Ausführen nur, wenn die letzte Nutzer-Nachricht eine klare Zustimmung enthält, z.B.:
+    - "Ja, bitte ausführen"
+    - "Ja, so senden"
+    - "Ja, ich bestätige"
+
+    Bedingungen:
+    - Betrag, Empfängeradresse und (bei ERC20) Token müssen unverändert sein.
+    - Wenn der Nutzer neue/abweichende Angaben macht (z.B. anderer Betrag/Empfänger/Token):
+      → zurück zu PHASE 1 und neue Zusammenfassung erstellen.
+    - Sobald eine gültige Bestätigung vorliegt:
+      → KEINE weitere Nachfrage und KEINE zusätzliche Bestätigungsschleife.
+
+    --------------------------------
+    PHASE 3 – AUSFÜHREN
+    --------------------------------
+    - ETH-Transaktion:
+      → Ethereum_Agent beauftragen, die ETH-Transaktion auszuführen.
+    - ERC20-Transaktion:
+      → Ethereum_Agent beauftragen, die Token-Transaktion auszuführen.
+
+    Regeln:
+    - Keine weiteren Rückfragen oder Validierungen.
+    - Danach kurze Quittung:
+      • Betrag
+      • Empfängeradresse
+      • Transaktions-Hash als "digitaler Beleg"
+
+    ========================
+    ANTWORTSTIL
+    ========================
+    - Kurz, klar, laienverständlich.
+    - Kein Fachjargon, keine Toolnamen.
+    - Bei Transaktionen immer:
+      - Phase 1: Betrag + Empfänger + Gebührenhinweis + Bestätigungsformel
+      - Phase 3: Betrag + Empfänger + Transaktions-Hash als Beleg
+                        
+      ========================
+      ALLTAGSANALOGIEN (IMMER AKTIV)
+      ========================
+      Zu JEDER Antwort fügst du am Ende genau EINE kurze Alltagsanalogie hinzu.
+
+      Ziel:
+      Die Analogie dient ausschliesslich der Einordnung für Laien.
+      Die Antwort muss auch OHNE Analogie vollständig korrekt und verständlich sein.
+
+      Regeln:
+      - Maximal 5 Sätze
+      - Ruhig, sachlich, vertrauensbildend
+      - Keine Fachbegriffe
+      - Keine Bewertungen oder Relativierungen
+      - Keine neuen Informationen
+
+      Bevorzugte Vergleichsbilder:
+      - Online-Banking
+      - persönlicher Assistent
+      - Berater
+      - Kontoauszug
+      - Quittung
+      - Auftrag / Überweisung
+    """)
+
+
+# =============================
+# Models
+# =============================
+
+# Keep models loaded in Ollama between turns instead of the default 5 minutes
+# (same variable and duration format as the Ollama server, e.g. "24h"; a negative duration like "-1m" keeps them loaded forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "1h")
+
+# One model handle per model id, shared by all agents that use it (one HTTP client each)
+WORKER_MODEL = Ollama(id="qwen2.5:3b", host=OLLAMA_HOST, keep_alive=OLLAMA_KEEP_ALIVE)    #If agents should run locally on ollama model use this line.
+#WORKER_MODEL = OpenAIChat(id="gpt-4o-mini")
+KNOWLEDGE_MODEL = Ollama(id="qwen2.5:7b", host=OLLAMA_HOST, keep_alive=OLLAMA_KEEP_ALIVE)    #If agent should run locally on ollama model use this line.
+#KNOWLEDGE_MODEL = OpenAIChat(id="gpt-4o-mini")
+LEADER_MODEL = Ollama(id="gpt-oss:20b", host=OLLAMA_HOST, keep_alive=OLLAMA_KEEP_ALIVE)    #If agent should run locally use this line. Delete "host" argument for ollama cloud model
+#LEADER_MODEL = OpenAIChat(id="gpt-4o-mini")
+
+
+def warm_up_models() -> None:
+    """Lädt alle lokalen Ollama-Modelle vorab, damit die erste Anfrage nicht auf das Laden warten muss."""
+    for model in (WORKER_MODEL, KNOWLEDGE_MODEL, LEADER_MODEL):
+        # Cloud models (no host set) and non-Ollama models have nothing to preload
+        if not isinstance(model, Ollama) or not model.host:
+            continue
+        try:
+            # A generate request without prompt only loads the model into memory
+            requests.post(
+                f"{model.host}/api/generate",
+                json={"model": model.id, "keep_alive": OLLAMA_KEEP_ALIVE},
+                timeout=120,
+            )
+        except Exception as e:
+            logger.warning("Could not preload Ollama model %s: %s", model.id, e)
+
+    # The embedding model is needed for the first knowledge search (and the knowledge import)
+    try:
+        requests.post(
+            f"{OLLAMA_HOST}/api/embed",
+            json={"model": EMBEDDER_MODEL, "input": "warmup", "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=120,
+        )
+    except Exception as e:
+        logger.warning("Could not preload Ollama model %s: %s", EMBEDDER_MODEL, e)
+
+
+# =============================
+# Team Setup
+# =============================
+
+# Only the last runs of a session are replayed to the leader (agno's default is 3).
+# Two cover a transaction: the phase-1 summary and the confirmation that follows it.
+MAX_HISTORY_RUNS = 2
+
+TEAM_DB_FILE = Path("tmp/ethereum_team.db")
+
+
+def _team_db() -> SqliteDb:
+    """SqliteDb für den Team-Verlauf, mit WAL statt Rollback-Journal für das Schreiben pro Turn."""
+
+    TEAM_DB_FILE.parent.mkdir(parents=True, exist_ok=True)
+    engine = create_engine(f"sqlite:///{TEAM_DB_FILE}")
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        # Keep recent history reads in memory: 256 MB mmap, 64 MB page cache
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.close()
+
+    return SqliteDb(db_engine=engine)
+
+
+def build_team(mcp_tools: MCPTools) -> Team:
+    """Baut die vier Agenten und den Teamleiter auf."""
+
+    #Ethereum Agent - handles real blockchain operations via MCP server
+    eth_agent = Agent(
+        name="Ethereum_Agent",
+        model=WORKER_MODEL,
+        tools=[mcp_tools],
+        instructions=_ETH_INSTRUCTIONS,
+        markdown=True,
+        debug_mode=DEBUG_MODE,
+    )
+
+    #Adress Book Agent - resolves names to wallet addresses
+    address_book_agent = Agent(
+        name="Address_Book_Agent",
+        model=WORKER_MODEL,
+        tools=[get_address_by_name],
+        instructions=_ADDRESS_BOOK_INSTRUCTIONS,
+        markdown=True,
+        debug_mode=DEBUG_MODE,
+    )
+
+    #Price Agent - provides ETH/CHF exchange rate via CoinGecko API
+    price_agent = Agent(
+        name="Price_Agent",
+        model=WORKER_MODEL,
+        tools=[get_eth_chf_price],
+        instructions=_PRICE_INSTRUCTIONS,
+        markdown=True,
+        #debug_mode=True,
+    )
+    
+    #Knowledge Agent - provides friendly explanations using the custom knowledge base
+    knowledge_agent = Agent(
+        name="Knowledge_Agent",
+        model=KNOWLEDGE_MODEL,
+        knowledge=get_knowledge(),
+        instructions=_KNOWLEDGE_INSTRUCTIONS,
+        search_knowledge=True,
+        markdown=True,
+        debug_mode=DEBUG_MODE,
+    )
+
+    #Team Leader - coordinating all agents
+    team = Team(
+        name="Ethereum_Assistant_Team",
+        members=[eth_agent, address_book_agent, price_agent, knowledge_agent],
+        model=LEADER_MODEL,
+        instructions=_TEAM_INSTRUCTIONS,
+        markdown=True,
+        debug_mode=DEBUG_MODE,
+
+        # Enables persistent multi-turn memory
+        db=_team_db(),
+        add_history_to_context=True,
+        num_history_runs=MAX_HISTORY_RUNS,
+    )
+
+    return team
+
+
+# The team holds no per-user state (history lives in SqliteDb per session_id), so one instance serves all turns
+_team: Team | None = None
+_team_lock = asyncio.Lock()
+
+
+async def get_team() -> Team:
+    """Baut das Team beim ersten Aufruf und gibt danach dieselbe Instanz zurück."""
+    global _team
+
+    async with _team_lock:
+        if _team is None:
+            # Opening/ingesting the knowledge base is blocking I/O, keep it off the event loop
+            await asyncio.to_thread(get_knowledge)
+            _team = build_team(await get_mcp_tools())
+
+    return _team
+
+
+# =============================
+# Response Cache
+# =============================
+
+# Repeated questions within a session (e.g. "Was ist eine DAO?") are answered without a new team run
+RESPONSE_CACHE_TTL = 600  # seconds
+_response_cache: TTLCache = TTLCache(maxsize=256, ttl=RESPONSE_CACHE_TTL)
+
+
+def _response_cache_key(message: str, session_id: str | None) -> tuple | None:
+    """
+    Cache key from session and normalized message, or None if the message must not be cached.
+    Only explanation questions answered from the knowledge base are cached: their answers come from static
+    documents, while everything else (DAO state, balances, prices, transactions) is live or has side effects.
+    """
+    if _route(message) != "Knowledge_Agent" or _is_outside_knowledge_base(message):
+        return None
+    return (session_id, " ".join(message.casefold().split()))
+
+
+# =============================
+# Transaction Prefetch
+# =============================
+
+# A new transfer request (not the "Ja, ..." confirmation) triggers the phase-1 lookups up front
+_TX_INTENT_RE = re.compile(r"\b(sende|senden|schick|überweis|transfer)", re.IGNORECASE)
+_CONFIRMATION_RE = re.compile(r"^\s*ja\b", re.IGNORECASE)
+_ETH_RE = re.compile(r"\b(eth|ether)\b", re.IGNORECASE)
+_TOKEN_RE = re.compile(r"token|erc20|vlz|voltaze", re.IGNORECASE)
+
+
+def _lookup_recipient(message: str) -> str | None:
+    """Sucht den ersten Namen aus dem Adressbuch in der Nachricht."""
+    address_book = _load_address_book()
+    for word in re.findall(r"\w+", message):
+        address = address_book.get(word.casefold())
+        if address is not None:
+            return f"Adresse von {word}: {address}"
+    return None
+
+
+async def _prefetch_transaction_facts(message: str) -> list[str]:
+    """
+    Ermittelt Adresse, ETH/CHF-Kurs und Netzwerkgebühren für Phase 1 gleichzeitig,
+    statt dass der Teamleiter die Agenten nacheinander fragt.
+    """
+    if not _TX_INTENT_RE.search(message) or _CONFIRMATION_RE.match(message):
+        return []
+
+    facts = []
+    recipient = _lookup_recipient(message)
+    if recipient is not None:
+        facts.append(recipient)
+
+    lookups = [call_mcp_tool("get_network_gas_price")]
+    if _ETH_RE.search(message) and not _TOKEN_RE.search(message):
+        lookups.append(_eth_chf_price())
+
+    for result in await asyncio.gather(*lookups, return_exceptions=True):
+        if isinstance(result, str) and not result.startswith(("Error", "Fehler")):
+            facts.append(result)
+
+    return facts
+
+
+async def _with_prefetched_facts(message: str) -> str:
+    """
+    Hängt die vorab ermittelten Phase-1-Informationen an die Nutzer-Nachricht an,
+    bzw. bei Erklärfragen ausserhalb der Knowledge Base den Hinweis, sie nicht zu durchsuchen.
+    """
+    if _is_outside_knowledge_base(message):
+        return message + "\n\n" + _NO_KB_SEARCH_HINT
+
+    facts = await _prefetch_transaction_facts(message)
+    if not facts:
+        return message
+
+    return message + "\n\n[Vorab ermittelt]\n" + "\n".join(f"- {fact}" for fact in facts)
+
+
+# =============================
+# Routing
+# =============================
+
+# One alternation with a named group per target, so a single scan classifies the message.
+# "leader": transfers, votes and live DAO/account state need the leader's tools, HITL phases and name
+# resolution. The other groups are single-domain questions that may be answered without an LLM run
+# (direct tool call or response cache); every LLM answer is still written by the team leader.
+_ROUTER_RE = re.compile(
+    r"(?P<leader>\b(?:sende|senden|send|schick|überweis|transfer|zahl|bezahl|pay|stimm|vote|votier|wähl"
+    r"|ausführen|bestätig|gewinner|proposals?|abstimmungen|vorlagen|guthaben|kontostand|balance|gas)"
+    r"|^\s*(?:ja|nein)\b)"
+    r"|(?P<Price_Agent>\b(?:kurs|preis|chf)\b)"
+    r"|(?P<Address_Book_Agent>\badresse\b)"
+    r"|(?P<Knowledge_Agent>^\s*(?:was ist|was sind|was bedeutet|erkläre|erklär|wie funktioniert)\b)",
+    re.IGNORECASE,
+)
+
+
+def _route(message: str) -> str | None:
+    """
+    Gibt den Bereich zurück, wenn genau einer passt und die Frage ohne Teamleiter beantwortbar ist.
+    Transaktionen, Abstimmungen, Kontostände, gemischte Fragen und Namen aus dem Adressbuch
+    (ausser bei der reinen Adressabfrage) gehen an den Teamleiter (None).
+    """
+    targets = {match.lastgroup for match in _ROUTER_RE.finditer(message)}
+    if "leader" in targets or len(targets) != 1:
+        return None
+    target = targets.pop()
+    if target != "Address_Book_Agent" and _lookup_recipient(message) is not None:
+        # Only the leader resolves names to addresses before handing them to other agents
+        return None
+    return target
+
+
+# Explanation questions without any of these terms are off-topic for the knowledge base (glossary)
+_KB_VOCAB_RE = re.compile(
+    r"\b(?:eth\b|ether|bitcoin|btc\b|krypto|crypto|blockchain|chain|block|ledger|dezentral|token|coin|stablecoin"
+    r"|smart|contract|vertr[aä]g|solidity|dao|governance|abstimm|voting|vote|proposal|vorlage"
+    r"|gas|gwei|wei\b|gebühr|fee|wallet|metamask|adresse|address|schlüssel|key|seed|signatur"
+    r"|transaktion|transaction|tx\b|hash|nonce|mining|miner|staking|validator|konsens|consensus|proof"
+    r"|defi|nft|web3|layer|rollup|node|knoten|fork|oracle|orakel|erc|hardhat|testnet|mainnet"
+    r"|evm\b|dapp|merkle|peer|p2p|shard|halving|airdrop|mint|burn|bridge|liquidit|exchange|börse"
+    r"|faucet|slashing|epoch|epoche|finalit|double.?spend|sybil|pos\b|pow\b|ico\b|private|public|verwahr|custod)",
+    re.IGNORECASE,
+)
+
+# The leader answers these itself, so no embedding and vector search is spent on them
+_NO_KB_SEARCH_HINT = "[Ohne Knowledge-Suche]"
+
+
+def _is_outside_knowledge_base(message: str) -> bool:
+    """True für Erklärfragen ohne Begriff aus der Knowledge Base (z.B. andere Coins oder Themen)."""
+    return _route(message) == "Knowledge_Agent" and not _KB_VOCAB_RE.search(message)
+
+
+# Words of a plain "what's the ETH/CHF price" question. Anything else (an amount, another coin or token,
+# another currency) changes the question: get_eth_chf_price only returns the price of 1 ETH in CHF,
+# so the team leader converts the amount or says that only ETH/CHF is supported.
+_PLAIN_PRICE_WORDS = frozenset("""
+    wie was ist sind steht hoch viel kostet kosten liegt beträgt aktuell aktuelle aktuellen aktueller
+    momentan gerade jetzt heute derzeit zurzeit im moment bitte mir sag sage zeig zeige gib nenn nenne
+    der die das des den dem ein einen eine von vom für in zu zum gegen gegenüber
+    kurs kurse preis preise wert eth ether ethereum chf franken schweizer
+""".split())
+
+
+def _is_plain_price_question(message: str) -> bool:
+    """True, wenn nur nach dem ETH/CHF-Kurs gefragt wird (ohne Betrag oder andere Währung)."""
+    return all(word in _PLAIN_PRICE_WORDS for word in re.findall(r"\w+", message.casefold()))
+
+
+async def _direct_answer(message: str) -> str | None:
+    """
+    Beantwortet reine Adress- und Kursfragen direkt über die Tool-Funktionen, ohne LLM.
+    Die Agenten geben das Tool-Ergebnis ohnehin unverändert zurück (stop_after_tool_call).
+    """
+    name = _route(message)
+    if name == "Price_Agent" and _is_plain_price_question(message):
+        return await _eth_chf_price()
+    if name == "Address_Book_Agent":
+        address_book = _load_address_book()
+        for word in re.findall(r"\w+", message):
+            if word.casefold() in address_book:
+                return _address_by_name(word)
+    return None
+
+
+# =============================
+# Small Talk
+# =============================
+
+# Pure greetings/thanks need neither an agent nor a knowledge search
+_SMALL_TALK_RE = re.compile(
+    r"^\s*(?:(?P<greeting>hallo|hi|hey|grüezi|guten (?:morgen|tag|abend))|(?P<thanks>danke|merci|vielen dank))\W*$",
+    re.IGNORECASE,
+)
+
+_SMALL_TALK_REPLIES = {
+    "greeting": "Hallo! Wie kann ich dir bei Ethereum, Transaktionen oder DAO-Abstimmungen helfen?",
+    "thanks": "Gern geschehen! Melde dich, wenn du noch etwas brauchst.",
+}
+
+
+def _small_talk_reply(message: str) -> str | None:
+    """Feste Antwort auf reine Begrüssungen/Danksagungen, sonst None."""
+    match = _SMALL_TALK_RE.match(message)
+    return _SMALL_TALK_REPLIES[match.lastgroup] if match else None
+
+
+# =============================
+# Semantic Cache
+# =============================
+
+# Answers to knowledge questions don't depend on the session, so they are shared across sessions and
+# also reused for rephrasings ("Was ist Ethereum?" / "Was ist eigentlich Ethereum")
+SEMANTIC_CACHE_TABLE = "response_cache"
+SEMANTIC_CACHE_MAX_DISTANCE = 0.10  # cosine distance
+_semantic_table: lancedb.table.Table | None = None
+_semantic_lock = threading.Lock()
+
+
+def _semantic_lookup(message: str) -> tuple[list[float] | None, str | None]:
+    """Embedding der Nachricht und die gespeicherte Antwort auf eine sehr ähnliche Frage (oder None)."""
+    global _semantic_table
+
+    try:
+        embedding = get_knowledge().vector_db.embedder.get_embedding(message)
+        if not embedding:
+            # Embedding failed (OllamaEmbedder returns []); neither look up nor store this question
+            return None, None
+        with _semantic_lock:
+            if _semantic_table is None:
+                db = lancedb.connect(LANCEDB_URI)
+                if SEMANTIC_CACHE_TABLE not in db.table_names():
+                    return embedding, None
+                _semantic_table = db.open_table(SEMANTIC_CACHE_TABLE)
+            hits = _semantic_table.search(embedding).distance_type("cosine").limit(1).to_list()
+    except Exception as e:
+        logger.warning("Semantic cache lookup failed: %s", e)
+        return None, None
+
+    if hits and hits[0]["_distance"] < SEMANTIC_CACHE_MAX_DISTANCE:
+        return embedding, hits[0]["response"]
+    return embedding, None
+
+
+def _semantic_store(embedding: list[float], message: str, response: str) -> None:
+    """Speichert die Antwort auf eine Wissensfrage für ähnliche Folgefragen."""
+    global _semantic_table
+
+    row = {"vector": embedding, "message": message, "response": response}
+    try:
+        with _semantic_lock:
+            if _semantic_table is None:
+                _semantic_table = lancedb.connect(LANCEDB_URI).create_table(
+                    SEMANTIC_CACHE_TABLE, data=[row], exist_ok=True
+                )
+            else:
+                _semantic_table.add([row])
+    except Exception as e:
+        logger.warning("Could not store response in semantic cache: %s", e)
+
+
+def _clear_semantic_cache() -> None:
+    """Verwirft alle gespeicherten Antworten, z.B. nach einem Neuimport der Knowledge Base."""
+    global _semantic_table
+
+    try:
+        with _semantic_lock:
+            _semantic_table = None
+            lancedb.connect(LANCEDB_URI).drop_table(SEMANTIC_CACHE_TABLE, ignore_missing=True)
+    except Exception as e:
+        logger.warning("Could not clear semantic cache: %s", e)
+
+
+# =============================
+# Session History
+# =============================
+
+async def _record_turn(session_id: str | None, message: str, response: str) -> None:
+    """
+    Speichert eine ohne Teamleiter beantwortete Frage im Team-Verlauf der Session,
+    damit spätere Team-Runs (z.B. eine Transaktionsbestätigung) sie im Kontext sehen.
+    """
+    if session_id is None:
+        return
+
+    team = await get_team()
+    # Direct answers create no run, and the leader only replays runs carrying its own team_id
+    team.set_id()
+    run = TeamRunOutput(
+        run_id=str(uuid.uuid4()),
+        team_id=team.id,
+        team_name=team.name,
+        session_id=session_id,
+        content=response,
+        messages=[Message(role="user", content=message), Message(role="assistant", content=response)],
+        status=RunStatus.completed,
+    )
+
+    def save() -> None:
+        session = team.get_session(session_id=session_id) or TeamSession(
+            session_id=session_id, team_id=team.id, created_at=int(time.time())
+        )
+        session.upsert_run(run)
+        team.save_session(session)
+
+    # SqliteDb is synchronous, keep the read-modify-write off the event loop
+    await asyncio.to_thread(save)
+
+
 # =============================
 # Agent Runner
 # =============================
 
+# Concurrent runs are capped at the number of parallel slots Ollama serves (OLLAMA_NUM_PARALLEL);
+# Ollama batches those slots itself, further requests would only queue up inside the server.
+_llm_slots = asyncio.Semaphore(int(os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+
+
+async def _pump_team_stream(stream: AsyncIterator, chunks: asyncio.Queue) -> None:
+    """Liest den Team-Stream in einem LLM-Slot und legt die Antwortteile in die Queue (None = Ende)."""
+    try:
+        async with _llm_slots:
+            async for chunk in stream:
+                # Only forward the leader's answer, not the member agents' intermediate output
+                if chunk.event == TeamRunEvent.run_content and isinstance(chunk.content, str):
+                    chunks.put_nowait(chunk.content)
+    finally:
+        chunks.put_nowait(None)
+
+
 async def run_agent(message: str, session_id: str | None = None) -> str:
     """Führt das Agent-Team aus und verarbeitet eine Nutzeranfrage."""
 
-    async with MCPTools("python mcp_server.py") as mcp_tools:
-        
-        #Ethereum Agent - handles real blockchain operations via MCP server
-        eth_agent = Agent(
-            name="Ethereum_Agent",
-            model=Ollama(id="qwen2.5:3b", host="http://localhost:11434"),    #If agent should run locally on ollama model use this line.
-            #model=OpenAIChat(id="gpt-4o-mini"),
-            tools=[mcp_tools],
-            instructions=dedent("""
-            Du bist Ethereum- und DAO-Assistent.
-
-            Rolle:
-            - Du führst Blockchain-Aktionen aus (Abstimmungen, ETH-/Token-Transaktionen).
-            - Du lieferst Netzwerk- und Gasinformationen auf Anfrage.
-            - Du entscheidest NICHT selbst über Bestätigungen, das macht immer der Teamleiter.
-
-            Regeln:
-            - Wenn der Teamleiter dich bittet, eine Transaktion auszuführen,
-              gilt das immer als bereits bestätigte Transaktion.
-            - Du stellst KEINE weiteren Rückfragen zur Bestätigung.
-
-            - Du führst send_eth und send_erc20_token NUR aus,
-              wenn der Teamleiter dich dazu beauftragt. 
-
-            - Wenn der Teamleiter in PHASE 1 eine Gebühren-/Gas-Schätzung verlangt:
-              - Nutze get_network_gas_price.
-              - Führe dabei KEINE Transaktion aus.
-              - Gib eine kurze, laienverständliche Einschätzung zurück:
-                • aktuelle Netzwerkgebühren (z.B. niedrig/mittel/hoch)
-                • optional ein kurzer Hinweis, dass Gebühren je nach Netzlast schwanken.
-
-            - Für reine Informationen verwendest du:
-              - dao_list_proposals, dao_get_winner, dao_vote
-              - get_eth_balance, get_erc20_token_balance
-              - get_network_gas_price
-
-            - Nach einer ausgeführten Transaktion erklärst du kurz:
-              • Betrag
-              • Empfängeradresse
-              • Transaktions-Hash als digitalen Zahlungsbeleg
-
-            - Du erwähnst niemals Toolnamen.
-            - Antworten immer kurz, klar und laienverständlich.
-            """),
-            markdown=True,
-            debug_mode=True,
-        )
+    reply = _small_talk_reply(message) or await _direct_answer(message)
+    if reply is not None:
+        await _record_turn(session_id, message, reply)
+        return reply
 
-        #Adress Book Agent - resolves names to wallet addresses
-        address_book_agent = Agent(
-            name="Address_Book_Agent",
-            model=Ollama(id="qwen2.5:3b", host="http://localhost:11434"),    #If agent should run locally on ollama model use this line.
-            #model=OpenAIChat(id="gpt-4o-mini"),
-            tools=[get_address_by_name],
-            instructions=dedent("""
-            Du bist nur für das Nachschlagen von Krypto-Adressen zuständig.
-
-            Regeln:
-            - Verwende ausschliesslich das Tool get_address_by_name.
-            - Keine Erklärungen zu Blockchain, DAO, Transaktionen etc.
-            - Antworte nur mit:
-              - gefundener Adresse oder
-              - klarer Fehlermeldung, wenn kein Eintrag existiert.
-            - Antwort kurz, ohne Zusatztexte.
-            """),
-            markdown=True,
-            debug_mode=True,
-        )
+    cache_key = _response_cache_key(message, session_id)
+    if cache_key in _response_cache:
+        await _record_turn(session_id, message, _response_cache[cache_key])
+        return _response_cache[cache_key]
 
-        #Price Agent - provides ETH/CHF exchange rate via CoinGecko API
-        price_agent = Agent(
-            name="Price_Agent",
-            model=Ollama(id="qwen2.5:3b", host="http://localhost:11434"),    #If agent should run locally on ollama model use this line.
-            #model=OpenAIChat(id="gpt-4o-mini"),
-            tools=[get_eth_chf_price],
-            instructions=dedent("""
-            Du bist nur für ETH/CHF-Preisabfragen zuständig.
-
-            Regeln:
-            - Wenn nach Preis oder Kurs von ETH/Ethereum in CHF gefragt wird,
-              nutze IMMER das Tool get_eth_chf_price.
-            - Erfinde niemals einen Kurs, nutze nur das Tool-Ergebnis.
-            - Antworte kurz, z.B.:
-              "1 ETH entspricht aktuell ca. X CHF. Der Kurs kann sich laufend ändern."
-            """),
-            markdown=True,
-            #debug_mode=True,
-        )
-        
-        #Knowledge Agent - provides friendly explanations using the custom knowledge base
-        knowledge_agent = Agent(
-            name="Knowledge_Agent",
-            model=Ollama(id="qwen2.5:7b", host="http://localhost:11434"),    #If agent should run locally on ollama model use this line.
-            #model=OpenAIChat(id="gpt-4o-mini"), #
-            knowledge=knowledge,
-            instructions=dedent("""
-            Du bist ein Erklär-Agent für Einsteiger zu Ethereum, Blockchain, Smart Contracts, DAOs usw.
-
-            WICHTIG:
-            - Vor jeder Antwort MUSST du zuerst die Knowledge Base über search_knowledge_base
-              mit der Nutzerfrage durchsuchen.
-            - Keine direkte Antwort ohne Knowledge-Suche.
-            """),
-            search_knowledge=True,
-            markdown=True,
-            debug_mode=True,
-        )
+    embedding = None
+    if cache_key is not None:
+        embedding, cached = await asyncio.to_thread(_semantic_lookup, message)
+        if cached is not None:
+            _response_cache[cache_key] = cached
+            await _record_turn(session_id, message, cached)
+            return cached
 
-        #Team Leader - coordinating all agents
-        team = Team(
-            name="Ethereum_Assistant_Team",
-            members=[eth_agent, address_book_agent, price_agent, knowledge_agent],
-            model=Ollama(id="gpt-oss:20b", host="http://localhost:11434"),    #If agent should run locally use this line. Delete "localhost" line for ollama cloud model
-            #model=OpenAIChat(id="gpt-4o-mini"),
-            instructions=dedent("""
-            Du koordinierst vier Agenten (Ethereum, Address Book, Price, Knowledge) und antwortest nur auf Deutsch.
-
-            Deine Aufgaben:
-            - Richte Nutzerfragen an den passenden Agenten.
-            - Halte den 3-Phasen-Ablauf bei Transaktionen strikt ein (HITL).
-            - Fasse Agenten-Antworten laienverständlich zusammen.
-            - Keine Toolnamen nennen. Keine internen Agenten-/Systemdetails nennen.
-
-            ========================
-            ROUTING
-            ========================
-            - DAO / Voting / Proposal / Gewinner / Abstimmungen → Ethereum_Agent
-            - Personennamen → Krypto-Adressen → Address_Book_Agent
-            - ETH/CHF-Kurs oder ETH-Preis in CHF → Price_Agent
-            - Grundlagen / Erklärungen (Ethereum, Blockchain, Smart Contracts, DAO etc.) → Knowledge_Agent
-            - Kombiniert (z.B. "Was ist Ethereum und wie ist der Kurs?"):
-              → Erst Knowledge_Agent (Erklärung), dann Price_Agent (Kurs).
-
-            WICHTIG:
-            - Der Price_Agent ist ausschliesslich für ETH/CHF zuständig.
-            - Tokenpreise (ERC20) werden NICHT über den Price_Agent abgefragt.
-            - Für Token-Transaktionen sind Preisangaben in CHF optional und werden standardmässig NICHT verlangt.
-
-            ========================
-            TRANSAKTIONSABLÄUFE (ETH & ERC20)
-            ========================
-            Wenn der Nutzer eine Transaktion ausführen will (ETH oder ERC20-Token), gilt strikt:
-
-            --------------------------------
-            PHASE 1 – ERKLÄRUNG (KEINE Ausführung)
-            --------------------------------
-            Ziel: Alle nötigen Details sammeln und eine klare Zusammenfassung liefern.
-            In Phase 1 dürfen KEINE Sende-Aktionen ausgeführt werden.
-
-            1) Empfänger klären
-            - Wenn ein Personenname genannt ist (z.B. "Patrick", "Alice"):
-              → Address_Book_Agent fragen und die Adresse übernehmen.
-            - Wenn eine Adresse angegeben ist:
-              → direkt verwenden.
-
-            2) Transaktionsart erkennen
-            - ETH-Transaktion: Nutzer schreibt ETH/Ether oder nennt ETH eindeutig.
-            - ERC20-Transaktion: Nutzer nennt "Token" oder einen Tokennamen (z.B. "Voltaze Token", "VLZ") oder sagt explizit ERC20.
-
-            3) Gebühren/Gas & Zusatzinfos beschaffen (PFLICHT)
-            - Bevor du die Phase-1-Zusammenfassung formulierst,
-              MUSST du den Ethereum_Agent nach den aktuellen Netzwerkgebühren fragen.
-            - Wenn keine exakte Schätzung möglich ist:
-              - gib eine qualitative Einschätzung (z.B. niedrig / mittel / hoch),
-              - aber brich die Transaktion NICHT ab.
-
-            - ETH-Transaktion:
-              - CHF-Wert von ETH über Price_Agent (nur ETH/CHF).
-              - Netzwerkgebühren über Ethereum_Agent.
-            - ERC20-Transaktion:
-              - KEINE CHF-Preisabfrage über Price_Agent.
-              - Netzwerkgebühren über Ethereum_Agent.
-              - Für die Überweisung/Transaktion muss das Guthaben nicht geprüft werden - weder bei dem Sender noch beim Empfänger.
-
-            4) Phase-1-Zusammenfassung formulieren (immer laienverständlich)
-            - ETH-Transaktion (Beispiel):
-              "Du möchtest X ETH (≈ Y CHF) an Adresse Z senden.
-              Geschätzte Netzwerkgebühren: G.
-              Wenn das so stimmt, antworte bitte mit: 'Ja, bitte ausführen'."
-            - ERC20-Transaktion (Beispiel):
-              "Du möchtest X [Tokenname] an Adresse Z senden.
-              Geschätzte Netzwerkgebühren: G.
-              Wenn das so stimmt, antworte bitte mit: 'Ja, bitte ausführen'."
-
-            Regeln in Phase 1:
-            - Wenn Betrag, Empfänger oder Tokenname fehlen/unklar sind: gezielte Rückfrage stellen.
-            - Wenn Tokenname unklar ist: nach exaktem Token (Name/Contract) fragen.
-            - Keine Aussagen wie "ich habe keinen Zugriff auf den Tokenpreis" als Abbruchgrund verwenden.
-              Stattdessen: CHF-Wert einfach weglassen (bei ERC20).
-            - Bei Fehlern (z.B. Whitelist/ungültige Adresse): klar erklären, dass es so nicht geht, und was benötigt wird.
-
-            --------------------------------
-            PHASE 2 – BESTÄTIGUNG
-            --------------------------------
-            Ausführen nur, wenn die letzte Nutzer-Nachricht eine klare Zustimmung enthält, z.B.:
-            - "Ja, bitte ausführen"
-            - "Ja, so senden"
-            - "Ja, ich bestätige"
-
-            Bedingungen:
-            - Betrag, Empfängeradresse und (bei ERC20) Token müssen unverändert sein.
-            - Wenn der Nutzer neue/abweichende Angaben macht (z.B. anderer Betrag/Empfänger/Token):
-              → zurück zu PHASE 1 und neue Zusammenfassung erstellen.
-            - Sobald eine gültige Bestätigung vorliegt:
-              → KEINE weitere Nachfrage und KEINE zusätzliche Bestätigungsschleife.
-
-            --------------------------------
-            PHASE 3 – AUSFÜHREN
-            --------------------------------
-            - ETH-Transaktion:
-              → Ethereum_Agent beauftragen, die ETH-Transaktion auszuführen.
-            - ERC20-Transaktion:
-              → Ethereum_Agent beauftragen, die Token-Transaktion auszuführen.
-
-            Regeln:
-            - Keine weiteren Rückfragen oder Validierungen.
-            - Danach kurze Quittung:
-              • Betrag
-              • Empfängeradresse
-              • Transaktions-Hash als "digitaler Beleg"
-
-            ========================
-            ANTWORTSTIL
-            ========================
-            - Kurz, klar, laienverständlich.
-            - Kein Fachjargon, keine Toolnamen.
-            - Bei Transaktionen immer:
-              - Phase 1: Betrag + Empfänger + Gebührenhinweis + Bestätigungsformel
-              - Phase 3: Betrag + Empfänger + Transaktions-Hash als Beleg
-                                
-              ========================
-              ALLTAGSANALOGIEN (IMMER AKTIV)
-              ========================
-              Zu JEDER Antwort fügst du am Ende genau EINE kurze Alltagsanalogie hinzu.
-
-              Ziel:
-              Die Analogie dient ausschliesslich der Einordnung für Laien.
-              Die Antwort muss auch OHNE Analogie vollständig korrekt und verständlich sein.
-
-              Regeln:
-              - Maximal 5 Sätze
-              - Ruhig, sachlich, vertrauensbildend
-              - Keine Fachbegriffe
-              - Keine Bewertungen oder Relativierungen
-              - Keine neuen Informationen
-
-              Bevorzugte Vergleichsbilder:
-              - Online-Banking
-              - persönlicher Assistent
-              - Berater
-              - Kontoauszug
-              - Quittung
-              - Auftrag / Überweisung
-            """),
-            markdown=True,
-            debug_mode=True,
-
-            # Enables persistent multi-turn memory
-            db=SqliteDb(db_file="tmp/ethereum_team.db"),
-            add_history_to_context=True,
-        )
+    team = await get_team()
 
+    async with _llm_slots:
         # Execute the team run
-        run_response = await team.arun(message, session_id=session_id)
+        run_response = await team.arun(await _with_prefetched_facts(message), session_id=session_id)
 
-        # Return the final answer to the UI
-        if hasattr(run_response, "content") and isinstance(run_response.content, str):
-            return run_response.content
+    # Return the final answer to the UI
+    if hasattr(run_response, "content") and isinstance(run_response.content, str):
+        if cache_key is not None:
+            _response_cache[cache_key] = run_response.content
+        if embedding is not None:
+            await asyncio.to_thread(_semantic_store, embedding, message, run_response.content)
+        return run_response.content
+
+    return str(run_response)
+
+
+async def run_agent_batch(
+    messages: list[str],
+    session_id: str | None = None,
+    max_concurrency: int = 4,
+) -> list[str]:
+    """
+    Verarbeitet mehrere Nutzeranfragen (z.B. für Evaluationen) mit demselben Team.
+
+    Ohne session_id laufen die Anfragen unabhängig voneinander in je einer eigenen Session
+    und werden gleichzeitig ausgeführt. Mit session_id gehören sie zu einem Gesprächsverlauf
+    und werden der Reihe nach ausgeführt.
+    """
+    if session_id is not None:
+        return [await run_agent(message, session_id=session_id) for message in messages]
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(message: str) -> str:
+        async with semaphore:
+            return await run_agent(message, session_id=str(uuid.uuid4()))
+
+    return await asyncio.gather(*(run_one(message) for message in messages))
+
+
+async def stream_agent(message: str, session_id: str | None = None) -> AsyncIterator[str]:
+    """Wie run_agent, liefert die Antwort des Teamleiters aber Stück für Stück."""
+
+    reply = _small_talk_reply(message) or await _direct_answer(message)
+    if reply is not None:
+        await _record_turn(session_id, message, reply)
+        yield reply
+        return
+
+    cache_key = _response_cache_key(message, session_id)
+    if cache_key in _response_cache:
+        await _record_turn(session_id, message, _response_cache[cache_key])
+        yield _response_cache[cache_key]
+        return
+
+    parts = []
+
+    embedding = None
+    if cache_key is not None:
+        embedding, cached = await asyncio.to_thread(_semantic_lookup, message)
+        if cached is not None:
+            _response_cache[cache_key] = cached
+            await _record_turn(session_id, message, cached)
+            yield cached
+            return
+
+    team = await get_team()
+    stream = team.arun(await _with_prefetched_facts(message), session_id=session_id, stream=True)
+
+    # The run is driven by its own task, so the LLM slot is released once the run ends,
+    # even if the consumer stops iterating and never closes this generator
+    chunks: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.create_task(_pump_team_stream(stream, chunks))
+    try:
+        while (content := await chunks.get()) is not None:
+            parts.append(content)
+            yield content
+        # Surface errors raised inside the team run
+        await producer
+    finally:
+        producer.cancel()
 
-        return str(run_response)
\ No newline at end of file
+    response = "".join(parts)
+    if cache_key is not None and parts:
+        _response_cache[cache_key] = response
+        if embedding is not None:
+            await asyncio.to_thread(_semantic_store, embedding, message, response)
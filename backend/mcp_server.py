@@ -1,29 +1,98 @@
 import os
 import json
 import asyncio
+import logging
+import re
+import time
+import aiohttp
+from cachetools import TTLCache
 from contextlib import asynccontextmanager
 from collections.abc import AsyncIterator
+from typing import Any
 from dataclasses import dataclass, field
+from decimal import Decimal
 from dotenv import load_dotenv
+from functools import lru_cache
 from pathlib import Path
-from web3 import Web3
+from eth_abi import encode as abi_encode
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
 from web3.exceptions import ContractLogicError
-from web3.contract import Contract
-from typing import Set
+from web3.types import RPCEndpoint, RPCResponse
+from web3.contract import AsyncContract
+from eth_account.signers.local import LocalAccount
 
 # Import FastMCP components
 from mcp.server.fastmcp import FastMCP, Context
 #from fastmcp import FastMCP, Context
 
+# uvloop/winloop event loop if installed, asyncio's otherwise
+from event_loop import new_event_loop
+
 #Load environment variables
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv(BASE_DIR / ".env")
 
-# --- Helper function ---
-def parse_address_list(env_value: str | None) -> Set[str]:
+# Logs go to stderr: with the stdio transport, stdout carries the MCP protocol
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("mcp_server")
+
+# --- Helper functions ---
+@lru_cache(maxsize=4096)
+def to_checksum(address: str) -> str:
+    """Web3.to_checksum_address (keccak over the address), memoized for recurring recipients."""
+    return Web3.to_checksum_address(address)
+
+
+_ADDR_RE = re.compile(r"(?:0x)?[0-9a-fA-F]{40}")
+
+
+def addr_bytes(address: str) -> bytes | None:
+    """Raw 20-byte form of a hex address, or None if it is malformed or has a wrong EIP-55 checksum."""
+    # fullmatch: "$" would also accept a trailing newline, which bytes.fromhex silently skips
+    if not _ADDR_RE.fullmatch(address):
+        return None
+    hex_part = address.removeprefix("0x")
+    # Mixed case means the address carries a checksum, which needs the 0x prefix and has to match
+    # (same rule as web3's validation of transaction addresses)
+    if hex_part not in (hex_part.lower(), hex_part.upper()) and (
+        hex_part == address or to_checksum(address) != address
+    ):
+        return None
+    return bytes.fromhex(hex_part)
+
+
+# ERC20 metadata per (chain ID, token address), so restarts don't need the decimals() RPC
+TOKEN_META_FILE = BASE_DIR / "tmp" / "token_meta.json"
+
+
+def load_token_decimals(chain_id: int, token_address: str) -> int | None:
+    try:
+        return json.loads(TOKEN_META_FILE.read_bytes()).get(f"{chain_id}:{token_address}")
+    except (OSError, ValueError):
+        return None
+
+
+def store_token_decimals(chain_id: int, token_address: str, decimals: int) -> None:
+    try:
+        meta = json.loads(TOKEN_META_FILE.read_bytes())
+    except (OSError, ValueError):
+        meta = {}
+    meta[f"{chain_id}:{token_address}"] = decimals
+    try:
+        TOKEN_META_FILE.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so a concurrent reader never sees half a file
+        tmp_file = TOKEN_META_FILE.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(meta))
+        os.replace(tmp_file, TOKEN_META_FILE)
+    except OSError as e:
+        logger.warning("Could not cache token metadata: %s", e)
+
+
+def parse_address_list(env_value: str | None) -> frozenset[bytes]:
     if not env_value:
-        return set()
-    return {Web3.to_checksum_address(addr.strip()) for addr in env_value.split(",") if Web3.is_address(addr.strip())}
+        return frozenset()
+    addresses = (addr_bytes(addr.strip()) for addr in env_value.split(","))
+    return frozenset(addr for addr in addresses if addr is not None)
 
 # --- Configuration ---
 NETWORK_RPC_URL = os.getenv("NETWORK_RPC_URL")
@@ -32,6 +101,21 @@ PRIVATE_KEY = os.getenv("PRIVATE_KEY")
 DAO_CONTRACT_ADDRESS = os.getenv("DAO_CONTRACT_ADDRESS")
 DAO_PROPOSAL_COUNT = int(os.getenv("DAO_PROPOSAL_COUNT", "3"))
 
+# Connection pool for the RPC node (one keep-alive session for all tool calls)
+RPC_MAX_CONNECTIONS = int(os.getenv("RPC_MAX_CONNECTIONS", "100"))
+RPC_KEEPALIVE_SECONDS = float(os.getenv("RPC_KEEPALIVE_SECONDS", "30"))
+# Requests issued within this window go to the node as one JSON-RPC batch (0 disables batching)
+RPC_BATCH_WINDOW_MS = float(os.getenv("RPC_BATCH_WINDOW_MS", "2"))
+
+# Gas price is polled in the background at roughly block time; tools read the cached value
+GAS_PRICE_POLL_SECONDS = float(os.getenv("GAS_PRICE_POLL_SECONDS", "4"))
+# A polled price older than this (e.g. the poll keeps failing) is replaced by a live RPC call
+GAS_PRICE_MAX_AGE_SECONDS = 3 * GAS_PRICE_POLL_SECONDS
+
+# Balances are served from a short-lived cache (seconds, roughly one block)
+BALANCE_TTL_SECONDS = float(os.getenv("BALANCE_TTL_SECONDS", "3"))
+BALANCE_CACHE_SIZE = 1024
+
 # Ensure the private key does not have the '0x' prefix for web3.py account loading
 if PRIVATE_KEY and PRIVATE_KEY.startswith('0x'):
     PRIVATE_KEY = PRIVATE_KEY[2:]
@@ -39,9 +123,6 @@ if PRIVATE_KEY and PRIVATE_KEY.startswith('0x'):
 TOKEN_CONTRACT_ADDRESS = os.getenv("ERC20_TOKEN_ADDRESS")
 #TOKEN_DECIMALS = int(os.getenv("ERC20_TOKEN_DECIMALS", 18)) # Default to 18 if not set
 
-ETH_WHITELIST = parse_address_list(os.getenv("ETH_WHITELIST"))
-ERC20_WHITELIST = parse_address_list(os.getenv("ERC20_WHITELIST"))
-
 # Standard ERC20 ABI (only the functions we need: 'balanceOf' and 'transfer')
 ERC20_ABI = json.loads("""
 [
@@ -72,6 +153,12 @@ ERC20_ABI = json.loads("""
 ]
 """)
 
+# Fixed gas limit for ERC20 transfers (0 = estimate per transfer); skips one eth_estimateGas round trip
+ERC20_TRANSFER_GAS_LIMIT = int(os.getenv("ERC20_TRANSFER_GAS_LIMIT", "0"))
+
+# 4-byte selector of transfer(address,uint256); transfer calldata is built directly from it
+ERC20_TRANSFER_SELECTOR = Web3.keccak(text="transfer(address,uint256)")[:4]
+
 # Dao Ballot Contract ABI
 DAO_ABI = json.loads("""
 [
@@ -158,15 +245,111 @@ DAO_ABI = json.loads("""
 """)
 
 
+# --- RPC Batching ---
+class BatchingHTTPProvider(AsyncHTTPProvider):
+    """
+    AsyncHTTPProvider that collects the requests of concurrent tool calls for a short
+    window and sends them as a single JSON-RPC batch, i.e. one HTTP round trip.
+
+    Dependent calls (e.g. send_raw_transaction after the nonce lookup) are awaited one
+    after the other by the tools, so they never end up in the same batch.
+    """
+
+    def __init__(self, endpoint_uri: str, batch_window_ms: float, **kwargs: Any) -> None:
+        super().__init__(endpoint_uri, **kwargs)
+        self._batch_window = batch_window_ms / 1000
+        self._pending: list[tuple[RPCEndpoint, Any, asyncio.Future]] = []
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if self._batch_window <= 0:
+            return await super().make_request(method, params)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((method, params, future))
+        if len(self._pending) == 1:
+            # First request of a new batch: flush once the window has passed
+            loop.call_later(self._batch_window, lambda: asyncio.ensure_future(self._flush()))
+        return await future
+
+    async def _flush(self) -> None:
+        pending, self._pending = self._pending, []
+        try:
+            if len(pending) == 1:
+                method, params, _ = pending[0]
+                responses = [await super().make_request(method, params)]
+            else:
+                responses = await self.make_batch_request([(method, params) for method, params, _ in pending])
+                if not isinstance(responses, list):
+                    # The node rejected the whole batch with a single error object
+                    responses = [responses] * len(pending)
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), response in zip(pending, responses):
+            if not future.done():
+                future.set_result(response)
+
+
 # --- Web3 Context ---
 @dataclass
 class Web3Context:
     """Context holding the Web3 connection and related objects."""
-    w3: Web3 | None = None
+    w3: AsyncWeb3 | None = None
+    chain_id: int | None = None # Chain ID used when signing transactions
     sender_address: str | None = None
-    token_contract: Contract | None = None # Use Contract type hint
+    sender_account: LocalAccount | None = None # Derived once from PRIVATE_KEY, used for signing
+    token_contract: AsyncContract | None = None # Use AsyncContract type hint
     token_decimals: int | None = None
-    dao_contract: Contract | None = None
+    token_scale: Decimal | None = None # 10**token_decimals, for exact unit conversion
+    dao_contract: AsyncContract | None = None
+    gas_price: int | None = None # Latest gas price in wei, refreshed by the background poll
+    gas_price_at: float = 0.0 # time.monotonic() when gas_price was fetched
+    eth_whitelist: frozenset[bytes] = frozenset() # Raw addresses, parsed once at startup; empty means no restriction
+    erc20_whitelist: frozenset[bytes] = frozenset()
+
+
+async def current_gas_price(web3_ctx: Web3Context) -> int:
+    """Cached gas price from the background poll; a live RPC call when there is none yet or it is stale."""
+    if web3_ctx.gas_price is not None and time.monotonic() - web3_ctx.gas_price_at < GAS_PRICE_MAX_AGE_SECONDS:
+        return web3_ctx.gas_price
+    return await refresh_gas_price(web3_ctx)
+
+
+async def refresh_gas_price(web3_ctx: Web3Context) -> int:
+    """Fetches the gas price from the node and stores it with its timestamp."""
+    gas_price = await web3_ctx.w3.eth.gas_price
+    web3_ctx.gas_price, web3_ctx.gas_price_at = gas_price, time.monotonic()
+    return gas_price
+
+
+async def poll_gas_price(web3_ctx: Web3Context) -> None:
+    """Keeps web3_ctx.gas_price up to date for the lifetime of the server."""
+    while True:
+        try:
+            await refresh_gas_price(web3_ctx)
+        except Exception as e:
+            logger.warning("Could not refresh gas price: %s", e)
+        await asyncio.sleep(GAS_PRICE_POLL_SECONDS)
+
+# Balance cache: address -> ETH balance, (token address, wallet) -> token balance
+_balance_cache: TTLCache = TTLCache(maxsize=BALANCE_CACHE_SIZE, ttl=BALANCE_TTL_SECONDS)
+
+
+async def cached_balance(key: str | tuple[str, str], fetch) -> int:
+    """Returns the balance for key from the cache, or awaits fetch() once the entry is older than BALANCE_TTL_SECONDS."""
+    balance = _balance_cache.get(key)
+    if balance is None:
+        balance = await fetch()
+        _balance_cache[key] = balance
+    return balance
+
+
+def invalidate_balances(*keys: str | tuple[str, str]) -> None:
+    """Drops cached balances that a just-sent transaction changes."""
+    for key in keys:
+        _balance_cache.pop(key, None)
 
 # --- Lifespan Management ---
 @asynccontextmanager
@@ -177,37 +360,49 @@ async def web3_lifespan(server: FastMCP) -> AsyncIterator[Web3Context]:
     Initializes the Web3 connection, derives the sender address,
     and loads the token contract based on environment variables.
     """
-    print("--- Initializing Web3 Connection (Lifespan Start) ---")
+    logger.info("--- Initializing Web3 Connection (Lifespan Start) ---")
     if not NETWORK_RPC_URL:
-        print("ERROR: NETWORK_RPC_URL not found in environment variables.")
+        logger.error("NETWORK_RPC_URL not found in environment variables.")
         raise ValueError("NETWORK_RPC_URL not found in environment variables.")
     if not NETWORK_ID:
-        print("ERROR: NETWORK_ID not found in environment variables.")
+        logger.error("NETWORK_ID not found in environment variables.")
         raise ValueError("NETWORK_ID not found in environment variables.")
     if not PRIVATE_KEY:
-        print("ERROR: PRIVATE_KEY not found in environment variables.")
+        logger.error("PRIVATE_KEY not found in environment variables.")
         raise ValueError("PRIVATE_KEY not found in environment variables.")
 
     w3_instance = None
+    gas_price_task = None
     sender_addr = None
+    sender_account = None
     token_contract_instance = None
     dao_contract_instance = None
 
     try:
-        print(f"Connecting to Network via: {NETWORK_RPC_URL}")
-        w3_instance = Web3(Web3.HTTPProvider(NETWORK_RPC_URL))
+        logger.info("Connecting to Network via: %s", NETWORK_RPC_URL)
+        # Async provider, so RPC round trips don't block the server's event loop
+        provider = BatchingHTTPProvider(NETWORK_RPC_URL, RPC_BATCH_WINDOW_MS)
+        # Pooled keep-alive session, created once and reused by every RPC call
+        await provider.cache_async_session(
+            aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=RPC_MAX_CONNECTIONS, keepalive_timeout=RPC_KEEPALIVE_SECONDS),
+                timeout=aiohttp.ClientTimeout(total=120, connect=5),
+            )
+        )
+        w3_instance = AsyncWeb3(provider)
 
-        if not w3_instance.is_connected():
+        if not await w3_instance.is_connected():
             raise ConnectionError(f"Failed to connect to Web3 provider at {NETWORK_RPC_URL}")
 
-        print(f"Successfully connected to Network. Chain ID: {w3_instance.eth.chain_id}")
-        if w3_instance.eth.chain_id != NETWORK_ID:
-            print(f"Warning: Connected chain ID ({w3_instance.eth.chain_id}) does not match expected Network ID ({NETWORK_ID})")
+        chain_id = await w3_instance.eth.chain_id
+        logger.info("Successfully connected to Network. Chain ID: %s", chain_id)
+        if chain_id != NETWORK_ID:
+            logger.warning("Connected chain ID (%s) does not match expected Network ID (%s)", chain_id, NETWORK_ID)
 
         # Load account from private key
-        account = w3_instance.eth.account.from_key(PRIVATE_KEY)
-        sender_addr = account.address
-        print(f"Using sender address: {sender_addr}")
+        sender_account = w3_instance.eth.account.from_key(PRIVATE_KEY)
+        sender_addr = sender_account.address
+        logger.info("Using sender address: %s", sender_addr)
 
         token_decimals = None
 
@@ -215,50 +410,66 @@ async def web3_lifespan(server: FastMCP) -> AsyncIterator[Web3Context]:
         if TOKEN_CONTRACT_ADDRESS:
             if not Web3.is_address(TOKEN_CONTRACT_ADDRESS):
                 raise ValueError(f"Invalid ERC20_TOKEN_ADDRESS: {TOKEN_CONTRACT_ADDRESS}")
-            print(f"Loading ERC20 token contract at: {TOKEN_CONTRACT_ADDRESS}")
+            logger.info("Loading ERC20 token contract at: %s", TOKEN_CONTRACT_ADDRESS)
             token_contract_instance = w3_instance.eth.contract(
-                address=Web3.to_checksum_address(TOKEN_CONTRACT_ADDRESS),
+                address=to_checksum(TOKEN_CONTRACT_ADDRESS),
                 abi=ERC20_ABI
             )
-            # Call decimals function safely
-            try:
-                token_decimals = token_contract_instance.functions.decimals().call()
-                print(f"Token has {token_decimals} decimals")
-            except Exception as e:
-                print(f"Warning: Could not fetch token decimals: {e}")
+            # Decimals from the local cache, otherwise call decimals function safely
+            token_decimals = load_token_decimals(chain_id, token_contract_instance.address)
+            if token_decimals is not None:
+                logger.info("Token has %s decimals (cached)", token_decimals)
+            else:
+                try:
+                    token_decimals = await token_contract_instance.functions.decimals().call()
+                    logger.info("Token has %s decimals", token_decimals)
+                    store_token_decimals(chain_id, token_contract_instance.address, token_decimals)
+                except Exception as e:
+                    token_decimals = 18
+                    logger.warning("Could not fetch token decimals (%s), assuming %s", e, token_decimals)
         else:
-            print("Warning: ERC20_TOKEN_ADDRESS not set. Token functions may fail.")
+            logger.warning("ERC20_TOKEN_ADDRESS not set. Token functions may fail.")
 
         # Load Dao Contract
         if DAO_CONTRACT_ADDRESS:
             if not Web3.is_address(DAO_CONTRACT_ADDRESS):
                 raise ValueError(f"Invalid DAO_CONTRACT_ADDRESS: {DAO_CONTRACT_ADDRESS}")
-            print(f"Loading DaoBallot contract at: {DAO_CONTRACT_ADDRESS}")
+            logger.info("Loading DaoBallot contract at: %s", DAO_CONTRACT_ADDRESS)
             dao_contract_instance = w3_instance.eth.contract(
-                address=Web3.to_checksum_address(DAO_CONTRACT_ADDRESS),
+                address=to_checksum(DAO_CONTRACT_ADDRESS),
                 abi=DAO_ABI,
             )
         else:
-            print("Warning: DAO_CONTRACT_ADDRESS not set. DAO tools will not work.")
+            logger.warning("DAO_CONTRACT_ADDRESS not set. DAO tools will not work.")
 
         # Create and yield the context object
         context = Web3Context(
             w3=w3_instance,
+            chain_id=NETWORK_ID,
             sender_address=sender_addr,
+            sender_account=sender_account,
             token_contract=token_contract_instance,
             token_decimals=token_decimals,
-            dao_contract=dao_contract_instance
+            token_scale=Decimal(10) ** token_decimals if token_decimals is not None else None,
+            dao_contract=dao_contract_instance,
+            eth_whitelist=parse_address_list(os.getenv("ETH_WHITELIST")),
+            erc20_whitelist=parse_address_list(os.getenv("ERC20_WHITELIST"))
         )
+        gas_price_task = asyncio.create_task(poll_gas_price(context))
         yield context
 
     except Exception as e:
-        print(f"FATAL ERROR during Web3 initialization: {e}")
+        logger.critical("FATAL ERROR during Web3 initialization: %s", e)
         # Ensure context resources are None if setup failed before yield
         context = Web3Context() # Yield an empty context or re-raise
         raise # Re-raise the exception to prevent server startup if critical
     finally:
-        # Cleanup logic if needed (though usually not required for Web3 HTTPProvider)
-        print("--- Web3 Lifespan End ---")
+        if gas_price_task is not None:
+            gas_price_task.cancel()
+        # Close the provider's pooled HTTP session
+        if w3_instance is not None:
+            await w3_instance.provider.disconnect()
+        logger.info("--- Web3 Lifespan End ---")
 
 
 # --- Initialize FastMCP Server ---
@@ -285,21 +496,22 @@ async def get_eth_balance(ctx: Context, address: str) -> str:
     """
     web3_ctx = ctx.request_context.lifespan_context
     w3 = web3_ctx.w3
-    if not w3 or not w3.is_connected():
-        return "Error: Web3 is not connected."
-    if not Web3.is_address(address):
+    # Malformed input is rejected before any RPC
+    if addr_bytes(address) is None:
         return f"Error: Invalid Ethereum address provided: {address}"
+    if not w3 or not await w3.is_connected():
+        return "Error: Web3 is not connected."
 
     try:
-        checksum_address = Web3.to_checksum_address(address)
-        balance_wei = w3.eth.get_balance(checksum_address)
+        checksum_address = to_checksum(address)
+        balance_wei = await cached_balance(checksum_address, lambda: w3.eth.get_balance(checksum_address))
         balance_eth = w3.from_wei(balance_wei, 'ether')
         result = f"Balance of {checksum_address}: {balance_eth} ETH"
-        print(result)
+        logger.info(result)
         return result
     except Exception as e:
         error_msg = f"Error getting ETH balance for {address}: {e}"
-        print(error_msg)
+        logger.error(error_msg)
         return error_msg
 
 
@@ -321,31 +533,35 @@ async def send_eth(ctx: Context, to_address: str, amount_eth: float) -> str:
     w3 = web3_ctx.w3
     sender_address = web3_ctx.sender_address
 
-    if not w3 or not w3.is_connected():
+    # Malformed input is rejected before any RPC
+    to_address_bytes = addr_bytes(to_address)
+    if to_address_bytes is None:
+        return f"Error: Invalid recipient address: {to_address}"
+    if not w3 or not await w3.is_connected():
         return "Error: Web3 is not connected."
     if not sender_address:
         return "Error: Sender address not configured."
-    if not Web3.is_address(to_address):
-        return f"Error: Invalid recipient address: {to_address}"
     if amount_eth <= 0:
         return "Error: Amount must be greater than 0."
     if not PRIVATE_KEY:
         return "Error: Private key not configured."
 
-    checksum_to_address = Web3.to_checksum_address(to_address)
     # Check against ETH whitelist
-    if ETH_WHITELIST and checksum_to_address not in ETH_WHITELIST:
+    if web3_ctx.eth_whitelist and to_address_bytes not in web3_ctx.eth_whitelist:
         return f"Error: Recipient address {to_address} is not whitelisted for ETH transfers."
 
-    sender_account = w3.eth.account.from_key(PRIVATE_KEY)
+    sender_account = web3_ctx.sender_account
 
     try:
-        nonce = w3.eth.get_transaction_count(sender_address)
-        gas_price = w3.eth.gas_price
+        checksum_to_address = to_checksum(to_address)
+        nonce, gas_price = await asyncio.gather(
+            w3.eth.get_transaction_count(sender_address),
+            current_gas_price(web3_ctx),
+        )
         value_wei = w3.to_wei(amount_eth, 'ether')
 
         tx = {
-            'chainId': int(NETWORK_ID),
+            'chainId': web3_ctx.chain_id,
             'nonce': nonce,
             'to': checksum_to_address,
             'value': value_wei,
@@ -354,15 +570,17 @@ async def send_eth(ctx: Context, to_address: str, amount_eth: float) -> str:
         }
 
         signed_tx = sender_account.sign_transaction(tx)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = await w3.eth.send_raw_transaction(signed_tx.raw_transaction)
         tx_hash_hex = tx_hash.hex()
 
-        print(f"ETH sent! Transaction hash: {tx_hash_hex}")
+        invalidate_balances(sender_address, checksum_to_address)
+
+        logger.info("ETH sent! Transaction hash: %s", tx_hash_hex)
         return f"Transaction submitted. Hash: {tx_hash_hex}"
 
     except Exception as e:
         error_msg = f"Error sending ETH: {e}"
-        print(error_msg)
+        logger.error(error_msg)
         return f"Error: {error_msg}"
 
 
@@ -385,34 +603,45 @@ async def get_erc20_token_balance(ctx: Context, wallet_address: str) -> str:
     token_contract = web3_ctx.token_contract
     sender_address = web3_ctx.sender_address # Get sender address for context
 
-    if not w3 or not w3.is_connected():
+    # Malformed input is rejected before any RPC
+    if addr_bytes(wallet_address) is None:
+        return f"Error: Invalid wallet address provided: {wallet_address}"
+    if not w3 or not await w3.is_connected():
         return "Error: Web3 is not connected."
     if not token_contract:
         return "Error: ERC20 Token contract not configured or loaded."
-    if not Web3.is_address(wallet_address):
-        return f"Error: Invalid wallet address provided: {wallet_address}"
 
     try:
-        checksum_wallet_address = Web3.to_checksum_address(wallet_address)
-        balance_smallest_unit = token_contract.functions.balanceOf(checksum_wallet_address).call()
-        token_decimals = web3_ctx.token_decimals or 18  # fallback
-        balance_normal = balance_smallest_unit / (10**token_decimals)
+        checksum_wallet_address = to_checksum(wallet_address)
+        token_scale = web3_ctx.token_scale
+        is_sender = bool(sender_address) and checksum_wallet_address == sender_address  # sender_address is already checksummed
+
+        if sender_address and not is_sender:
+            # Both balances in parallel: one round trip instead of two
+            balance_smallest_unit, sender_balance_smallest = await asyncio.gather(
+                cached_balance((token_contract.address, checksum_wallet_address),
+                               token_contract.functions.balanceOf(checksum_wallet_address).call),
+                cached_balance((token_contract.address, sender_address),
+                               token_contract.functions.balanceOf(sender_address).call),
+            )
+        else:
+            balance_smallest_unit = await cached_balance((token_contract.address, checksum_wallet_address),
+                                                         token_contract.functions.balanceOf(checksum_wallet_address).call)
+        balance_normal = Decimal(balance_smallest_unit) / token_scale
 
         result = f"Token balance of {checksum_wallet_address} ({token_contract.address}): {balance_normal}"
-        print(result)
+        logger.info(result)
 
         # Add sender balance info for convenience
-        if sender_address and checksum_wallet_address == Web3.to_checksum_address(sender_address):
+        if is_sender:
              result += f" (This is the server's configured address)"
         elif sender_address:
-             sender_checksum = Web3.to_checksum_address(sender_address)
-             sender_balance_smallest = token_contract.functions.balanceOf(sender_checksum).call()
-             sender_balance_normal = sender_balance_smallest / (10**token_decimals)
-             print(f"Server's ({sender_address}) token balance: {sender_balance_normal}")
+             sender_balance_normal = Decimal(sender_balance_smallest) / token_scale
+             logger.debug("Server's (%s) token balance: %s", sender_address, sender_balance_normal)
         return result
     except Exception as e:
         error_msg = f"Error getting token balance for {wallet_address}: {e}"
-        print(error_msg)
+        logger.error(error_msg)
         return error_msg
 
 
@@ -429,18 +658,18 @@ async def get_network_gas_price(ctx: Context) -> str:
     """
     web3_ctx = ctx.request_context.lifespan_context
     w3 = web3_ctx.w3
-    if not w3 or not w3.is_connected():
+    if not w3 or not await w3.is_connected():
         return "Error: Web3 is not connected."
 
     try:
-        gas_price_wei = w3.eth.gas_price
+        gas_price_wei = await current_gas_price(web3_ctx)
         gas_price_gwei = w3.from_wei(gas_price_wei, 'gwei')
         result = f"Current gas price: {gas_price_gwei} Gwei"
-        print(result)
+        logger.info(result)
         return result
     except Exception as e:
         error_msg = f"Error getting gas price: {e}"
-        print(error_msg)
+        logger.error(error_msg)
         return error_msg
 
 @mcp.tool()
@@ -463,88 +692,99 @@ async def send_erc20_token(ctx: Context, to_address: str, amount: float) -> str:
     w3 = web3_ctx.w3
     sender_address = web3_ctx.sender_address
     token_contract = web3_ctx.token_contract
-    token_decimals = web3_ctx.token_decimals or 18  # fallback
+    token_scale = web3_ctx.token_scale
 
     # --- Input and Context Validation ---
-    if not w3 or not w3.is_connected():
+    # Malformed input is rejected before any RPC
+    to_address_bytes = addr_bytes(to_address)
+    if to_address_bytes is None:
+        return f"Error: Invalid recipient address: {to_address}"
+    if not w3 or not await w3.is_connected():
         return "Error: Web3 is not connected."
     if not sender_address:
          return "Error: Sender address not configured or loaded."
     if not token_contract:
         return "Error: Token contract not configured or loaded."
-    if not Web3.is_address(to_address):
-        return f"Error: Invalid recipient address: {to_address}"
     if amount <= 0:
         return "Error: Amount must be positive."
     if not PRIVATE_KEY: # Check again ensure private key loaded
         return "Error: Server private key not available."
 
-    checksum_to_address = Web3.to_checksum_address(to_address)
     # Check against ERC20 whitelist
-    if ERC20_WHITELIST and checksum_to_address not in ERC20_WHITELIST:
+    if web3_ctx.erc20_whitelist and to_address_bytes not in web3_ctx.erc20_whitelist:
             return f"Error: Recipient address {to_address} is not whitelisted for ERC20 transfers."
 
-    sender_account = w3.eth.account.from_key(PRIVATE_KEY) # Need account object to sign
+    sender_account = web3_ctx.sender_account # Need account object to sign
 
-    # Convert amount to the token's smallest unit
-    amount_in_smallest_unit = int(amount * (10**token_decimals))
-
-    print(f"Attempting to send {amount} tokens ({amount_in_smallest_unit} smallest units) "
-          f"from {sender_address} to {checksum_to_address}...")
+    # Convert amount to the token's smallest unit (via str, so no float rounding creeps in)
+    amount_in_smallest_unit = int(Decimal(str(amount)) * token_scale)
 
     try:
-        # 1. Get nonce
-        nonce = w3.eth.get_transaction_count(sender_address)
-        print(f"Using nonce: {nonce}")
+        checksum_to_address = to_checksum(to_address)
+        logger.info("Attempting to send %s tokens (%s smallest units) from %s to %s...",
+                    amount, amount_in_smallest_unit, sender_address, checksum_to_address)
+
+        # 1. Get nonce, gas price and gas estimate - independent of each other, so in parallel
+        lookups = [
+            w3.eth.get_transaction_count(sender_address),
+            current_gas_price(web3_ctx),
+        ]
+        if not ERC20_TRANSFER_GAS_LIMIT:
+            lookups.append(token_contract.functions.transfer(
+                checksum_to_address,
+                amount_in_smallest_unit
+            ).estimate_gas({'from': sender_address}))
+        nonce, gas_price, *estimate = await asyncio.gather(*lookups, return_exceptions=True)
+        estimated_gas = estimate[0] if estimate else None
+        for value in (nonce, gas_price):
+            if isinstance(value, Exception):
+                raise value
+        logger.debug("Using nonce: %s", nonce)
 
         # 2. Prepare the transaction
-        current_gas_price = w3.eth.gas_price
         tx_data = {
-            'chainId': int(NETWORK_ID),
-            'from': sender_address, # Required for estimateGas
-            'gasPrice': current_gas_price,
+            'chainId': web3_ctx.chain_id,
+            'gasPrice': gas_price,
             'nonce': nonce,
-             # 'gas' will be estimated
         }
 
-        # Estimate gas
-        try:
-            estimated_gas = token_contract.functions.transfer(
-                checksum_to_address,
-                amount_in_smallest_unit
-            ).estimate_gas(tx_data) # Pass tx params for accurate estimate
-            tx_data['gas'] = int(estimated_gas * 1.2) # Add 20% buffer
-            print(f"Estimated gas: {estimated_gas}, using limit: {tx_data['gas']}")
-        except ContractLogicError as e:
-             err_msg = f"Gas estimation failed: {e}. Check sender's token balance."
-             print(err_msg)
+        if ERC20_TRANSFER_GAS_LIMIT:
+            tx_data['gas'] = ERC20_TRANSFER_GAS_LIMIT
+        elif isinstance(estimated_gas, ContractLogicError):
+             err_msg = f"Gas estimation failed: {estimated_gas}. Check sender's token balance."
+             logger.error(err_msg)
              return f"Error: {err_msg}" # Return error if estimation fails
-        except Exception as e:
+        elif isinstance(estimated_gas, Exception):
             tx_data['gas'] = 200000 # Fallback gas limit
-            print(f"Warning: Gas estimation failed ({e}), using default limit {tx_data['gas']}")
-
-        # Remove 'from' if it was added only for estimateGas, as build_transaction adds it
-        tx_data.pop('from', None)
-
-        # Build the final transaction object for signing
-        transaction = token_contract.functions.transfer(
-            checksum_to_address,
-            amount_in_smallest_unit
-        ).build_transaction(tx_data)
+            logger.warning("Gas estimation failed (%s), using default limit %s", estimated_gas, tx_data['gas'])
+        else:
+            tx_data['gas'] = int(estimated_gas * 1.2) # Add 20% buffer
+            logger.debug("Estimated gas: %s, using limit: %s", estimated_gas, tx_data['gas'])
+
+        # Build the final transaction object for signing (all fields are known, no ABI lookup needed)
+        transaction = {
+            **tx_data,
+            'to': token_contract.address,
+            'value': 0,
+            'data': ERC20_TRANSFER_SELECTOR + abi_encode(['address', 'uint256'], [checksum_to_address, amount_in_smallest_unit]),
+        }
 
         # 3. Sign the transaction
         signed_tx = sender_account.sign_transaction(transaction)
-        print("Transaction signed.")
+        logger.debug("Transaction signed.")
 
         # 4. Send the transaction
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = await w3.eth.send_raw_transaction(signed_tx.raw_transaction)
         tx_hash_hex = tx_hash.hex()
-        print(f"Transaction sent! Hash: {tx_hash_hex}")
+        invalidate_balances(sender_address,
+                            (token_contract.address, sender_address),
+                            (token_contract.address, checksum_to_address))
+        logger.info("Transaction sent! Hash: %s", tx_hash_hex)
         #print(f"View on Sepolia Etherscan: https://sepolia.etherscan.io/tx/{tx_hash_hex}")
 
         # 5. Wait for confirmation (Optional - uncomment if needed, but makes the tool slow)
         # print(f"Waiting for transaction receipt (this may take a while)...")
-        # tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+        # tx_receipt = await w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
         # if tx_receipt['status'] == 1:
         #     print(f"Transaction successful! Block: {tx_receipt['blockNumber']}")
         #     return f"Success! Tx Hash: {tx_hash_hex}"
@@ -557,18 +797,16 @@ async def send_erc20_token(ctx: Context, to_address: str, amount: float) -> str:
 
     except ValueError as ve:
          error_msg = f"Value Error during transaction: {ve}"
-         print(error_msg)
+         logger.error(error_msg)
          return f"Error: {error_msg}"
     except ContractLogicError as cle:
         # This often happens due to insufficient balance or other contract rules
         error_msg = f"Contract Logic Error: {cle}"
-        print(error_msg)
+        logger.error(error_msg)
         return f"Contract Error: {error_msg}"
     except Exception as e:
         error_msg = f"An unexpected error occurred: {e}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception(error_msg)
         return f"Unexpected Error: {e}"
 
 
@@ -583,7 +821,7 @@ async def dao_list_proposals(ctx: Context) -> str:
     w3 = web3_ctx.w3
     dao_contract = web3_ctx.dao_contract
 
-    if not w3 or not w3.is_connected():
+    if not w3 or not await w3.is_connected():
         return "Error: Web3 is not connected."
     if not dao_contract:
         return "Error: DAO contract not configured or loaded."
@@ -591,7 +829,7 @@ async def dao_list_proposals(ctx: Context) -> str:
     lines = ["Aktuell laufende Abstimmungen:\n"]
     for i in range(DAO_PROPOSAL_COUNT):
         try:
-            name, vote_count = dao_contract.functions.proposals(i).call()
+            name, vote_count = await dao_contract.functions.proposals(i).call()
             lines.append(
                 f"- {name} – aktuell {vote_count} Stimme(n), die diese Vorlage unterstützen."
             )
@@ -610,14 +848,14 @@ async def dao_get_winner(ctx: Context) -> str:
     w3 = web3_ctx.w3
     dao_contract = web3_ctx.dao_contract
 
-    if not w3 or not w3.is_connected():
+    if not w3 or not await w3.is_connected():
         return "Error: Web3 is not connected."
     if not dao_contract:
         return "Error: DAO contract not configured or loaded."
 
     try:
-        winning_index = dao_contract.functions.winningProposal().call()
-        winner_name = dao_contract.functions.winnerName().call()
+        winning_index = await dao_contract.functions.winningProposal().call()
+        winner_name = await dao_contract.functions.winnerName().call()
         return f"Aktueller Gewinner ist Proposal {winning_index}: \"{winner_name}\""
     except Exception as e:
         return f"Error getting winner: {e}"
@@ -633,7 +871,7 @@ async def dao_vote(ctx: Context, proposal_index: int) -> str:
     dao_contract = web3_ctx.dao_contract
     sender_address = web3_ctx.sender_address
 
-    if not w3 or not w3.is_connected():
+    if not w3 or not await w3.is_connected():
         return "Error: Web3 is not connected."
     if not dao_contract:
         return "Error: DAO contract not configured or loaded."
@@ -645,19 +883,20 @@ async def dao_vote(ctx: Context, proposal_index: int) -> str:
         return f"Error: Ungültiger Proposal-Index {proposal_index}. Erlaubt: 0..{DAO_PROPOSAL_COUNT - 1}"
 
     try:
-        account = w3.eth.account.from_key(PRIVATE_KEY)
-        nonce = w3.eth.get_transaction_count(sender_address)
-        gas_price = w3.eth.gas_price
-
-        # Gas schätzen
-        gas_estimate = dao_contract.functions.vote(proposal_index).estimate_gas(
-            {"from": sender_address}
+        account = web3_ctx.sender_account
+        # Nonce, Gaspreis und Gasschätzung hängen nicht voneinander ab: parallel abfragen
+        nonce, gas_price, gas_estimate = await asyncio.gather(
+            w3.eth.get_transaction_count(sender_address),
+            current_gas_price(web3_ctx),
+            dao_contract.functions.vote(proposal_index).estimate_gas(
+                {"from": sender_address}
+            ),
         )
         gas_limit = int(gas_estimate * 1.2)
 
-        tx = dao_contract.functions.vote(proposal_index).build_transaction(
+        tx = await dao_contract.functions.vote(proposal_index).build_transaction(
             {
-                "chainId": int(NETWORK_ID),
+                "chainId": web3_ctx.chain_id,
                 "from": sender_address,
                 "nonce": nonce,
                 "gasPrice": gas_price,
@@ -666,19 +905,21 @@ async def dao_vote(ctx: Context, proposal_index: int) -> str:
         )
 
         signed_tx = account.sign_transaction(tx)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = await w3.eth.send_raw_transaction(signed_tx.raw_transaction)
         tx_hash_hex = tx_hash.hex()
 
-        print(f"DAO vote tx sent: {tx_hash_hex}")
+        invalidate_balances(sender_address) # gas was paid
+
+        logger.info("DAO vote tx sent: %s", tx_hash_hex)
         return f"DAO-Stimme abgegeben. Transaktions-Hash: {tx_hash_hex}"
 
     except ContractLogicError as cle:
         msg = f"Contract logic error while voting: {cle}"
-        print(msg)
+        logger.error(msg)
         return f"Error: {msg}"
     except Exception as e:
         msg = f"Error sending DAO vote transaction: {e}"
-        print(msg)
+        logger.error(msg)
         return f"Error: {msg}"
 
 @mcp.tool()
@@ -690,7 +931,7 @@ async def dao_find_proposal_by_name(ctx: Context, query: str) -> str:
     w3 = web3_ctx.w3
     dao_contract = web3_ctx.dao_contract
 
-    if not w3 or not w3.is_connected():
+    if not w3 or not await w3.is_connected():
         return "Error: Web3 is not connected."
     if not dao_contract:
         return "Error: DAO contract not configured or loaded."
@@ -700,7 +941,7 @@ async def dao_find_proposal_by_name(ctx: Context, query: str) -> str:
 
     for i in range(DAO_PROPOSAL_COUNT):
         try:
-            name, _ = dao_contract.functions.proposals(i).call()
+            name, _ = await dao_contract.functions.proposals(i).call()
             if q in name.lower():
                 matches.append(f"{i}:{name}")
         except Exception as e:
@@ -720,27 +961,35 @@ async def main():
 
     #print(f"\nStarting Sepolia MCP Server ({mcp.tool_id})...")
     #print(f"Host: {mcp.host}, Port: {mcp.port}")
-    print(f"Transport: {transport}")
+    logger.info("Transport: %s", transport)
 
     if transport == 'sse':
-        print("Running with SSE transport. Access tools via HTTP requests.")
+        logger.info("Running with SSE transport. Access tools via HTTP requests.")
         await mcp.run_sse_async()
     elif transport == 'stdio':
-        print("Running with stdio transport. Interact via console.")
+        logger.info("Running with stdio transport. Interact via console.")
         await mcp.run_stdio_async()
     else:
-        print(f"Error: Unknown transport '{transport}'. Use 'sse' or 'stdio'.")
+        logger.error("Unknown transport '%s'. Use 'sse' or 'stdio'.", transport)
 
 if __name__ == "__main__":
     # Basic check for essential env vars before starting asyncio loop
     if not NETWORK_RPC_URL or not NETWORK_ID or not PRIVATE_KEY:
-         print("ERROR: Essential environment variables (NETWORK_RPC_URL, NETWORK_ID, PRIVATE_KEY) are missing.")
-         print("Please check your .env file.")
+         logger.error("Essential environment variables (NETWORK_RPC_URL, NETWORK_ID, PRIVATE_KEY) are missing. "
+                      "Please check your .env file.")
     else:
         try:
-             asyncio.run(main())
+             # Like asyncio.run(main()), but on new_event_loop (loop_factory needs Python 3.12)
+             loop = new_event_loop()
+             asyncio.set_event_loop(loop)
+             try:
+                 loop.run_until_complete(main())
+             finally:
+                 loop.run_until_complete(loop.shutdown_asyncgens())
+                 asyncio.set_event_loop(None)
+                 loop.close()
         except (ValueError, ConnectionError) as e:
              # Catch errors during lifespan setup if they weren't handled internally
-             print(f"\nFailed to start server due to error during initialization: {e}")
+             logger.error("Failed to start server due to error during initialization: %s", e)
         except KeyboardInterrupt:
-             print("\nServer stopped by user.")
+             logger.info("Server stopped by user.")
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The backend modules are plain scripts, not a package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,198 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import mcp_client
+
+
+DIMENSIONS = mcp_client.CachedOllamaEmbedder.dimensions
+
+
+class FakeOllamaClient:
+    """Records every embed request; returns one fixed-size vector per input text."""
+
+    def __init__(self):
+        self.batch_calls = 0
+        self.single_calls = 0
+        self.down = False
+
+    def embed(self, model, input, **kwargs):
+        if self.down:
+            raise ConnectionError("Ollama is not running")
+        if isinstance(input, str):
+            self.single_calls += 1
+            return {"embeddings": [[0.1] * DIMENSIONS]}
+        self.batch_calls += 1
+        return {"embeddings": [[0.1] * DIMENSIONS for _ in input]}
+
+
+class FakeAsyncOllamaClient:
+    def __init__(self, client: FakeOllamaClient):
+        self.client = client
+
+    async def embed(self, model, input, **kwargs):
+        return self.client.embed(model, input, **kwargs)
+
+
+@pytest.fixture
+def fake_ollama(monkeypatch, tmp_path):
+    client = FakeOllamaClient()
+    async_client = FakeAsyncOllamaClient(client)
+    monkeypatch.setattr(mcp_client.CachedOllamaEmbedder, "client", property(lambda self: client))
+    monkeypatch.setattr(mcp_client.CachedOllamaEmbedder, "aclient", property(lambda self: async_client))
+    monkeypatch.setattr(mcp_client, "LANCEDB_URI", str(tmp_path / "lancedb"))
+    monkeypatch.setattr(mcp_client, "INGEST_STAMP", tmp_path / "lancedb" / ".ingest_stamp")
+    monkeypatch.setattr(mcp_client, "_knowledge", None)
+    mcp_client._embedding_cache.clear()
+    return client
+
+
+def test_embedder_keeps_batching_enabled():
+    embedder = mcp_client.CachedOllamaEmbedder(id=mcp_client.EMBEDDER_MODEL)
+    assert embedder.enable_batch
+
+
+def test_knowledge_ingestion_embeds_in_batches(fake_ollama, monkeypatch, tmp_path):
+    knowledge_path = tmp_path / "knowledge"
+    knowledge_path.mkdir()
+    paragraphs = [f"Absatz {i}: " + "Ethereum ist eine Blockchain mit Smart Contracts. " * 20 for i in range(300)]
+    (knowledge_path / "glossar.txt").write_text("\n\n".join(paragraphs))
+    monkeypatch.setattr(mcp_client, "KNOWLEDGE_PATH", knowledge_path)
+
+    knowledge = mcp_client.get_knowledge()
+
+    rows = knowledge.vector_db.get_count()
+    assert rows > mcp_client.CachedOllamaEmbedder.batch_size
+    assert fake_ollama.single_calls == 0
+    assert fake_ollama.batch_calls == -(-rows // mcp_client.CachedOllamaEmbedder.batch_size)
+    assert mcp_client.INGEST_STAMP.exists()
+
+
+def test_failed_embeddings_leave_no_ingest_stamp(fake_ollama, monkeypatch, tmp_path):
+    knowledge_path = tmp_path / "knowledge"
+    knowledge_path.mkdir()
+    (knowledge_path / "glossar.txt").write_text("Ethereum ist eine Blockchain mit Smart Contracts.")
+    monkeypatch.setattr(mcp_client, "KNOWLEDGE_PATH", knowledge_path)
+    fake_ollama.down = True
+
+    mcp_client.get_knowledge()
+
+    assert not mcp_client.INGEST_STAMP.exists()
+
+
+@pytest.fixture
+def fixed_price(monkeypatch):
+    async def eth_chf_price():
+        return "1 ETH entspricht aktuell ungefähr 3000.00 CHF (Quelle: CoinGecko)."
+
+    monkeypatch.setattr(mcp_client, "_eth_chf_price", eth_chf_price)
+
+
+@pytest.mark.parametrize("message", [
+    "Wie ist der ETH-Kurs?",
+    "Was kostet Ethereum in CHF?",
+    "ETH/CHF Kurs",
+    "Wie hoch ist der Preis von Ether aktuell?",
+])
+def test_plain_eth_price_question_is_answered_directly(fixed_price, message):
+    assert asyncio.run(mcp_client._direct_answer(message)).startswith("1 ETH entspricht")
+
+
+@pytest.mark.parametrize("message", [
+    "Preis von Bitcoin",
+    "Kurs des VLZ Tokens",
+    "5 ETH in CHF",
+    "Wie ist der ETH Kurs in USD?",
+])
+def test_other_price_questions_go_to_the_leader(fixed_price, message):
+    assert mcp_client._route(message) == "Price_Agent"
+    assert asyncio.run(mcp_client._direct_answer(message)) is None
+
+
+@pytest.mark.parametrize("message", [
+    "Zahle Alice 0.5 ETH aus meinem Guthaben",
+    "Send 0.1 ETH to 0x5FbDB2315678afecb367f032d93F642f64180aa3, what's the gas?",
+    "Ich möchte für Proposal 1 votieren",
+    "Wähle Proposal 1",
+    "Wie ist der Kontostand von Alice?",
+    "Wie viel CHF hat Robin?",
+])
+def test_transactions_votes_and_names_go_to_the_leader(message):
+    assert mcp_client._route(message) is None
+
+
+class FakeTeam:
+    """Streams a fixed answer in three chunks, like the leader's run_content events."""
+
+    async def arun(self, message, session_id=None, stream=False):
+        for content in ("Dein ", "Kontostand ", "ist 1 ETH."):
+            yield SimpleNamespace(event=mcp_client.TeamRunEvent.run_content, content=content)
+
+
+def test_abandoned_stream_releases_the_llm_slot(monkeypatch):
+    async def get_team():
+        return FakeTeam()
+
+    async def scenario():
+        monkeypatch.setattr(mcp_client, "_llm_slots", asyncio.Semaphore(1))
+        monkeypatch.setattr(mcp_client, "get_team", get_team)
+
+        stream = mcp_client.stream_agent("Wie ist mein Kontostand?")
+        assert await stream.__anext__() == "Dein "
+        # The consumer goes away without closing the generator
+        await asyncio.sleep(0.01)
+        assert not mcp_client._llm_slots.locked()
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def semantic_cache(monkeypatch, tmp_path):
+    """Semantic cache in a temporary LanceDB, with the given embedder in place of the knowledge base's."""
+    monkeypatch.setattr(mcp_client, "LANCEDB_URI", str(tmp_path / "lancedb"))
+    monkeypatch.setattr(mcp_client, "_semantic_table", None)
+
+    def use(embedder):
+        knowledge = SimpleNamespace(vector_db=SimpleNamespace(embedder=embedder))
+        monkeypatch.setattr(mcp_client, "get_knowledge", lambda: knowledge)
+
+    return use
+
+
+def test_failed_embedding_is_not_cached(semantic_cache):
+    semantic_cache(SimpleNamespace(get_embedding=lambda text: []))
+
+    assert mcp_client._semantic_lookup("Was ist Ethereum?") == (None, None)
+    assert mcp_client._semantic_table is None
+
+
+def test_reimport_clears_the_semantic_cache(semantic_cache):
+    semantic_cache(SimpleNamespace(get_embedding=lambda text: [1.0, 0.0, 0.0]))
+    mcp_client._semantic_store([1.0, 0.0, 0.0], "Was ist Ethereum?", "Ethereum ist eine Blockchain.")
+    assert mcp_client._semantic_lookup("Was ist Ethereum?")[1] == "Ethereum ist eine Blockchain."
+
+    mcp_client._clear_semantic_cache()
+
+    assert mcp_client._semantic_lookup("Was ist Ethereum?")[1] is None
+
+
+def test_similar_but_different_question_is_no_semantic_hit(semantic_cache):
+    embedder = mcp_client.CachedOllamaEmbedder(id=mcp_client.EMBEDDER_MODEL, host=mcp_client.OLLAMA_HOST)
+    semantic_cache(embedder)
+    embedding, _ = mcp_client._semantic_lookup("Was ist Ethereum?")
+    if not embedding:
+        pytest.skip(f"Ollama with {mcp_client.EMBEDDER_MODEL} is not available")
+
+    mcp_client._semantic_store(embedding, "Was ist Ethereum?", "Ethereum ist eine Blockchain.")
+
+    assert mcp_client._semantic_lookup("Was ist Ethereum?")[1] == "Ethereum ist eine Blockchain."
+    assert mcp_client._semantic_lookup("Was ist Bitcoin?")[1] is None
+
+
+@pytest.mark.parametrize("message", ["Was ist Solana?", "Erkläre Cardano", "Was ist USDC?", "Was ist Sepolia?"])
+def test_questions_outside_the_knowledge_base_go_to_the_leader(message):
+    assert asyncio.run(mcp_client._direct_answer(message)) is None
+    assert mcp_client._response_cache_key(message, None) is None
+    prompt = asyncio.run(mcp_client._with_prefetched_facts(message))
+    assert prompt.endswith(mcp_client._NO_KB_SEARCH_HINT)
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+# mcp_server reads its network configuration at import time
+os.environ.setdefault("NETWORK_ID", "31337")
+
+import mcp_server  # noqa: E402
+
+
+CHECKSUMMED = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+RAW = bytes.fromhex(CHECKSUMMED[2:])
+
+
+@pytest.mark.parametrize("address", [
+    CHECKSUMMED,
+    CHECKSUMMED.lower(),
+    "0x" + CHECKSUMMED[2:].upper(),
+    CHECKSUMMED[2:].lower(),
+    CHECKSUMMED[2:].upper(),
+])
+def test_valid_addresses_are_parsed(address):
+    assert mcp_server.addr_bytes(address) == RAW
+
+
+@pytest.mark.parametrize("address", [
+    CHECKSUMMED + "\n",
+    CHECKSUMMED.lower() + "\n",
+    CHECKSUMMED.replace("F", "f", 1),  # bad checksum
+    CHECKSUMMED[2:],  # checksummed without 0x prefix
+    CHECKSUMMED[:-1],
+    CHECKSUMMED + "0",
+    "0x" + "g" * 40,
+])
+def test_malformed_addresses_are_rejected(address):
+    assert mcp_server.addr_bytes(address) is None